@@ -0,0 +1,112 @@
+import sys
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("lease-invoice-forecast")
+@click.option("--from-date", required=True, help="First posting date to include (YYYY-MM-DD)")
+@click.option("--to-date", required=True, help="Last posting date to include (YYYY-MM-DD)")
+@click.option("--company", default=None, help="Only forecast contracts of this Owner/Lessor")
+@click.option("--output", default=None, help="CSV file to write; defaults to stdout")
+@pass_context
+def lease_invoice_forecast(context, from_date, to_date, company=None, output=None):
+    """Write the invoices the lease invoice job would create in a date range as CSV, without creating them."""
+    import frappe
+    from masar_mall.jobs.invoice_forecast import iter_forecast_csv, iter_invoice_forecast
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        stream = open(output, "w", newline="") if output else sys.stdout
+        try:
+            for chunk in iter_forecast_csv(iter_invoice_forecast(from_date, to_date, company)):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
+    finally:
+        frappe.destroy()
+
+
+@click.command("lease-schedule-reconcile")
+@click.option("--chunk-size", default=2000, type=int, help="Schedules reconciled per statement pair")
+@pass_context
+def lease_schedule_reconcile(context, chunk_size=2000):
+    """Resync schedule row invoice statuses and period counters from Sales Invoices with set-based SQL."""
+    import frappe
+    from masar_mall.jobs.invoice_task import reconcile_schedule_statuses
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        result = reconcile_schedule_statuses(chunk_size=chunk_size)
+        click.echo(f"{result.schedules} schedules corrected")
+    finally:
+        frappe.destroy()
+
+
+@click.command("lease-contract-import")
+@click.argument("path")
+@click.option("--no-submit", is_flag=True, default=False, help="Create the contracts as drafts")
+@click.option("--skip-invalid", is_flag=True, default=False, help="Import the valid contracts even if others fail validation")
+@click.option("--batch-size", default=50, type=int, help="Contracts per transaction")
+@click.option("--output", default=None, help="CSV file for the per-contract results; defaults to stdout")
+@pass_context
+def lease_contract_import(context, path, no_submit=False, skip_invalid=False, batch_size=50, output=None):
+    """Create and submit Lease Contracts from a CSV or JSON file of contract terms."""
+    import frappe
+    from masar_mall.jobs.lease_import import import_lease_contracts, iter_import_results_csv
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            content = f.read()
+
+        results = import_lease_contracts(
+            content,
+            "json" if path.lower().endswith(".json") else "csv",
+            submit=not no_submit,
+            batch_size=batch_size,
+            skip_invalid=skip_invalid,
+        )
+
+        stream = open(output, "w", newline="") if output else sys.stdout
+        try:
+            for chunk in iter_import_results_csv(results):
+                stream.write(chunk)
+        finally:
+            if output:
+                stream.close()
+    finally:
+        frappe.destroy()
+
+
+@click.command("floor-occupancy-rebuild")
+@click.option("--property", default=None, help="Only rebuild the floors of this Property")
+@pass_context
+def floor_occupancy_rebuild(context, property=None):
+    """Recount the Floor Occupancy summary of every floor from its Floor Units."""
+    import frappe
+    from masar_mall.utils.floor_occupancy import rebuild_floor_occupancy
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+
+    try:
+        floors = rebuild_floor_occupancy(property)
+        frappe.db.commit()
+        click.echo(f"{floors} floors rebuilt")
+    finally:
+        frappe.destroy()
+
+
+commands = [lease_invoice_forecast, lease_schedule_reconcile, lease_contract_import, floor_occupancy_rebuild]
@@ -145,6 +145,33 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+    "Sales Invoice": {
+        "on_submit": "masar_mall.jobs.invoice_events.sales_invoice_status_changed",
+        "on_cancel": "masar_mall.jobs.invoice_events.sales_invoice_status_changed",
+        "on_update_after_submit": "masar_mall.jobs.invoice_events.sales_invoice_status_changed",
+    },
+    "Payment Entry": {
+        "on_submit": "masar_mall.jobs.invoice_events.payment_entry_changed",
+        "on_cancel": "masar_mall.jobs.invoice_events.payment_entry_changed",
+    },
+    "Item": {
+        "on_update": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "after_rename": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "on_trash": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+    },
+    "Warehouse": {
+        "on_update": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "after_rename": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "on_trash": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+    },
+    "Account": {
+        "on_update": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "after_rename": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+        "on_trash": "masar_mall.utils.rental_space_config.clear_rental_space_config",
+    },
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -254,7 +281,10 @@ fixtures = [
                 "Customer-custom_general_contact",
                 "Customer-custom_represented_by",
                 "Item-custom_service_percentage",
-                "Customer-custom_business_purpose"
+                "Customer-custom_business_purpose",
+                "Company-custom_consolidate_other_services",
+                "Company-custom_consolidate_tenant_billing",
+                "Sales Invoice Item-custom_lease_contract"
             ]
         ]
     ]},
@@ -0,0 +1,172 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import json
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import now_datetime, time_diff_in_seconds
+
+
+STAGES = ("select", "build", "insert", "write_back")
+
+COUNTERS = {
+    "leases": "contracts_scanned",
+    "invoices": "invoices_created",
+    "schedules": "schedules_updated",
+    "skipped": "skipped_count",
+    "errors": "error_count",
+}
+
+
+def start_billing_run(job, batches=1, **values):
+    """Create the Lease Billing Run record a job (and all of its batches) report into.
+
+    Extra `values`, e.g. the planner's `select_time`, are set on the record as given.
+    """
+    run = frappe.get_doc({
+        "doctype": "Lease Billing Run",
+        "job": job,
+        "status": "Running",
+        "started": now_datetime(),
+        "batches": batches,
+        "pending_batches": batches,
+        **values,
+    })
+    run.insert(ignore_permissions=True)
+    frappe.db.commit()
+    return run.name
+
+
+def restart_billing_run(run_name, batches):
+    frappe.db.set_value("Lease Billing Run", run_name, {
+        "status": "Running",
+        "pending_batches": batches,
+        "finished": None,
+    }, update_modified=False)
+    frappe.db.commit()
+
+
+class BillingRunLog:
+    """Collects stage timings, counters, skip reasons and the query count of one batch of
+    a billing job and adds them to its Lease Billing Run record.
+
+    Use it as a context manager; while active it is reachable from `billing_stage` and
+    `log_skip` so deeply nested code can report without extra arguments. When an exception
+    escapes the batch, the counters gathered so far in `result` are flushed and the run is
+    marked Failed before the exception propagates.
+    """
+
+    def __init__(self, run_name, result=None):
+        self.run_name = run_name
+        self.result = result
+        self.timings = dict.fromkeys(STAGES, 0.0)
+        self.skip_reasons = {}
+        self.query_count = 0
+        self.flushed = False
+        self._db_sql = None
+
+    def __enter__(self):
+        self._db_sql = frappe.db.sql
+
+        def counted_sql(*args, **kwargs):
+            self.query_count += 1
+            return self._db_sql(*args, **kwargs)
+
+        frappe.db.sql = counted_sql
+        frappe.local.lease_billing_run = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        frappe.local.lease_billing_run = None
+        frappe.db.sql = self._db_sql
+
+        if exc_type and not self.flushed:
+            frappe.db.rollback()
+            result = self.result if self.result is not None else {}
+            result["errors"] = result.get("errors", 0) + 1
+            self.flush(result, failed=True)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.monotonic() - start
+
+    def note_skip(self, reason):
+        self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + 1
+
+    def flush(self, result, failed=False):
+        """Add this batch to the run record; the last pending batch finishes the run, as Failed
+        when this or any earlier batch failed."""
+        assignments = [f"`{field}` = `{field}` + %({key})s" for key, field in COUNTERS.items()]
+        assignments += [f"`{stage}_time` = `{stage}_time` + %({stage}_time)s" for stage in STAGES]
+
+        values = {key: result.get(key, 0) for key in COUNTERS}
+        values.update({f"{stage}_time": self.timings[stage] for stage in STAGES})
+        values.update({"name": self.run_name, "query_count": self.query_count})
+
+        skip_reasons = frappe.db.sql(
+            "SELECT skip_reasons FROM `tabLease Billing Run` WHERE name = %s FOR UPDATE",
+            self.run_name
+        )
+        merged = json.loads(skip_reasons[0][0] or "{}") if skip_reasons else {}
+        for reason, count in self.skip_reasons.items():
+            merged[reason] = merged.get(reason, 0) + count
+        values["skip_reasons"] = json.dumps(merged, indent=1, sort_keys=True)
+
+        frappe.db.sql(f"""
+            UPDATE `tabLease Billing Run`
+            SET
+                {", ".join(assignments)},
+                query_count = query_count + %(query_count)s,
+                skip_reasons = %(skip_reasons)s,
+                pending_batches = pending_batches - 1
+            WHERE name = %(name)s
+        """, values)
+
+        run = frappe.db.get_value(
+            "Lease Billing Run", self.run_name, ["pending_batches", "started", "status"], as_dict=True
+        )
+        if run:
+            failed = failed or run.status == "Failed"
+            if run.pending_batches <= 0:
+                finish_billing_run(self.run_name, run.started, status="Failed" if failed else "Completed")
+            elif failed:
+                frappe.db.set_value("Lease Billing Run", self.run_name, "status", "Failed", update_modified=False)
+
+        frappe.db.commit()
+        self.flushed = True
+
+
+def finish_billing_run(run_name, started, status="Completed"):
+    finished = now_datetime()
+    frappe.db.set_value("Lease Billing Run", run_name, {
+        "status": status,
+        "finished": finished,
+        "wall_time": time_diff_in_seconds(finished, started),
+    }, update_modified=False)
+
+
+@contextmanager
+def billing_stage(name):
+    """Time a stage against the active BillingRunLog, if any."""
+    run_log = getattr(frappe.local, "lease_billing_run", None)
+    if not run_log:
+        yield
+        return
+
+    with run_log.stage(name):
+        yield
+
+
+def log_skip(reason, title):
+    """Log why an invoice was not created and count the reason on the active run."""
+    frappe.log_error(reason, title)
+
+    run_log = getattr(frappe.local, "lease_billing_run", None)
+    if run_log:
+        run_log.note_skip(reason)
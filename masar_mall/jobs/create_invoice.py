@@ -1,297 +1,959 @@
 # Copyright (c) 2025, KCSC and contributors
 # For license information, please see license.txt
 
+import json
+import time
+import zlib
+
 import frappe
-from frappe.utils import getdate, nowdate, flt, rounded
+from frappe.utils import getdate, nowdate, flt, cint, rounded
+from masar_mall.jobs.billing_run import (
+    BillingRunLog,
+    billing_stage,
+    finish_billing_run,
+    log_skip,
+    restart_billing_run,
+    start_billing_run,
+)
+from masar_mall.jobs.invoice_ledger import get_idempotency_key, get_ledger_invoice, record_ledger_entry
+from masar_mall.jobs.invoice_resolver import InvoiceReferenceResolver
+from masar_mall.jobs.invoice_task import refresh_schedule_counters
+
+
+# Number of shards the due contracts are split into and the most contracts a
+# single background job handles; both can be overridden from site_config.json.
+DEFAULT_INVOICE_SHARDS = 4
+DEFAULT_INVOICE_BATCH_SIZE = 200
+
+RUN_SUMMARY_FIELDS = ("leases", "invoices", "schedules", "skipped", "errors")
+
+# Backfill defaults: periods per contract per run, invoice rate and run time in seconds
+DEFAULT_BACKFILL_MAX_PER_CONTRACT = 12
+DEFAULT_BACKFILL_INVOICES_PER_MINUTE = 60
+DEFAULT_BACKFILL_TIME_BUDGET = 1800
+
+# Global default pointing at today's run, whose record holds the plan; each batch keeps its
+# own checkpoint next to it
+RUN_PLAN_KEY = "masar_mall_invoice_run_plan"
+CHECKPOINT_DONE = "__done__"
+
+
+def check_lease_end_and_create_invoice(now=False):
+    """Plan the due work and hand it to background jobs on the long queue, one per shard batch.
+
+    If today's previous run did not finish, its unfinished batches are resumed from their
+    checkpoints instead of planning again. Pass `now=True` to run every batch synchronously
+    in the current process and get the aggregated summary back.
+    """
+    today = getdate(nowdate())
 
+    plan = get_pending_run_plan(today)
+    if plan:
+        frappe.logger().info(f"Lease Invoice Job | Resuming run {plan['run_id']}")
+        restart_billing_run(plan["run_id"], len(plan["pending"]))
+    else:
+        try:
+            plan = plan_invoice_run(today)
+        except Exception as e:
+            frappe.log_error(e, "Lease Invoice Job | Failed to fetch due lease periods")
+            return
 
-def check_lease_end_and_create_invoice():
-    today = getdate(nowdate())
+    if not plan:
+        frappe.logger().info("Lease Invoice Job | No due lease periods or services found")
+        return
 
-    try:
-        leases = frappe.get_all(
-            "Lease Contract",
-            filters={
-                "status": "Rent",
-                "docstatus": 1,
-            },
-            fields=["name", "lease_end"]
+    run_id = plan["run_id"]
+    pending = plan["pending"]
+
+    summary = frappe._dict(dict.fromkeys(RUN_SUMMARY_FIELDS, 0), run_id=run_id, batches=len(pending))
+
+    for idx in pending:
+        result = frappe.enqueue(
+            "masar_mall.jobs.create_invoice.process_invoice_batch",
+            queue="long",
+            timeout=3600,
+            job_id=f"lease_invoice_job|{run_id}|{idx}",
+            deduplicate=not now,
+            now=now,
+            run_id=run_id,
+            batch_idx=idx,
+            lease_names=plan["batches"][idx],
+            today=str(today),
         )
-    except Exception as e:
-        frappe.log_error(e, "Lease Invoice Job | Failed to fetch Lease Contracts")
-        return
 
-    if not leases:
-        frappe.log_error("No active Lease Contracts found", "Lease Invoice Job")
-        return
+        if now and result:
+            for field in RUN_SUMMARY_FIELDS:
+                summary[field] += result[field]
+
+    return summary if now else run_id
+
+
+def plan_invoice_run(today):
+    """Split today's due contracts into shard batches and persist the plan as the run checkpoint.
+
+    The batches are kept on the Lease Billing Run every batch reports into, which is marked
+    Failed if the plan cannot be saved.
+    """
+    started = time.monotonic()
+    due_rows = get_due_schedule_rows(today)
+    service_leases = get_leases_with_due_services(today)
+    select_time = time.monotonic() - started
+    if not due_rows and not service_leases:
+        return None
+
+    # Contracts of one tenant and lessor stay in the same batch so their periods can be
+    # billed together when the company consolidates tenant billing
+    billing_keys = {
+        row.lease_contract: (row.tenant_lessee or "", row.owner_lessor or "")
+        for row in list(due_rows) + list(service_leases)
+    }
+
+    shard_count = cint(frappe.conf.get("masar_mall_invoice_shards")) or DEFAULT_INVOICE_SHARDS
+    batch_size = cint(frappe.conf.get("masar_mall_invoice_batch_size")) or DEFAULT_INVOICE_BATCH_SIZE
+
+    batches = []
+    for shard in split_into_shards(billing_keys, shard_count):
+        batch = []
+        for lease_names in shard:
+            if batch and len(batch) + len(lease_names) > batch_size:
+                batches.append(sorted(batch))
+                batch = []
+            batch.extend(lease_names)
+        if batch:
+            batches.append(sorted(batch))
+
+    run_id = start_billing_run(
+        "Create Invoices", len(batches), select_time=select_time, run_plan=json.dumps(batches)
+    )
+    try:
+        save_run_plan(today, run_id)
+    except Exception:
+        frappe.db.rollback()
+        finish_billing_run(run_id, frappe.db.get_value("Lease Billing Run", run_id, "started"), status="Failed")
+        frappe.db.commit()
+        raise
 
-    for lease in leases:
-        try:
-            if lease.lease_end and today > getdate(lease.lease_end):
+    return {"date": str(today), "run_id": run_id, "batches": batches, "pending": list(range(len(batches)))}
+
+
+def split_into_shards(billing_keys, shard_count):
+    """Split contracts into `shard_count` shards by a stable hash of their (tenant, lessor) key.
+
+    Each shard is a list of contract groups, one group per billing key.
+    """
+    groups = {}
+    for lease_name in sorted(billing_keys):
+        groups.setdefault(billing_keys[lease_name], []).append(lease_name)
+
+    shards = [[] for _ in range(max(shard_count, 1))]
+    for billing_key in sorted(groups):
+        shard_idx = zlib.crc32("|".join(billing_key).encode()) % len(shards)
+        shards[shard_idx].append(groups[billing_key])
+    return [shard for shard in shards if shard]
+
+
+def process_invoice_batch(run_id, batch_idx, lease_names, today):
+    today = getdate(today)
+    result = frappe._dict(dict.fromkeys(RUN_SUMMARY_FIELDS, 0))
+
+    with BillingRunLog(run_id, result) as run_log:
+        resolver = InvoiceReferenceResolver()
+
+        with run_log.stage("select"):
+            resolver.prefetch_items(lease_names)
+            due_rows = get_due_schedule_rows(today, lease_names)
+
+        consolidated_rows = []
+        individual_rows = []
+        for row in due_rows:
+            if consolidates_tenant_billing(row.owner_lessor, resolver):
+                consolidated_rows.append(row)
+            else:
+                individual_rows.append(row)
+
+        due_by_lease = group_due_rows(individual_rows)
+
+        # Consolidated periods are billed across contracts first; a resumed batch repeats this
+        # step, but only for the rows that are still uninvoiced
+        if consolidated_rows:
+            process_consolidated_rows(consolidated_rows, resolver, result)
+
+        # Skip the contracts a crashed attempt of this batch already finished
+        resume_after = get_batch_checkpoint(run_id, batch_idx)
+        if resume_after:
+            lease_names = [lease for lease in lease_names if lease > resume_after]
+
+        for lease_name in lease_names:
+            process_lease(lease_name, due_by_lease.get(lease_name, {}), today, resolver, result)
+            set_batch_checkpoint(run_id, batch_idx, lease_name)
+            frappe.db.commit()
+
+        set_batch_checkpoint(run_id, batch_idx, CHECKPOINT_DONE)
+        frappe.db.commit()
+
+        resolver.log_stats(f"Lease Invoice Job | {run_id}")
+        run_log.flush(result)
+
+    frappe.logger().info(
+        f"Lease Invoice Job | {run_id} | Batch {batch_idx}: {result.leases} contracts, {result.invoices} invoices, "
+        f"{result.schedules} schedules updated, {result.skipped} skipped, {result.errors} errors"
+    )
+    return result
+
+
+def consolidates_tenant_billing(company, resolver):
+    return bool(company and resolver.get_company(company).custom_consolidate_tenant_billing)
+
+
+def process_consolidated_rows(due_rows, resolver, result):
+    """Bill due periods of several contracts of one tenant, lessor and posting date on one invoice."""
+    lease_docs = {}
+    schedule_docs = {}
+
+    for billing_key, rows in group_consolidated_rows(due_rows):
+        bill_consolidated_group(billing_key, rows, resolver, result, lease_docs, schedule_docs)
+
+
+def group_consolidated_rows(due_rows):
+    """Return `[((tenant, lessor, posting date), rows)]` in billing key order."""
+    groups = {}
+    for row in due_rows:
+        groups.setdefault((row.tenant_lessee, row.owner_lessor, getdate(row.lease_start)), []).append(row)
+
+    return [(key, groups[key]) for key in sorted(groups, key=lambda key: (key[0] or "", key[1], key[2]))]
+
+
+def bill_consolidated_group(billing_key, rows, resolver, result, lease_docs=None, schedule_docs=None):
+    """Create the consolidated invoice of one billing key and commit its write-back."""
+    lease_docs = {} if lease_docs is None else lease_docs
+    schedule_docs = {} if schedule_docs is None else schedule_docs
+    updates = {}
+
+    try:
+        lines = []
+        for row in rows:
+            if row.lease_contract not in lease_docs:
+                lease_docs[row.lease_contract] = frappe.get_doc("Lease Contract", row.lease_contract)
+            if row.schedule not in schedule_docs:
+                schedule_docs[row.schedule] = frappe.get_doc("Lease Contract Schedule", row.schedule)
+
+            schedule_doc = schedule_docs[row.schedule]
+            payment_row = next((d for d in schedule_doc.invoice if d.name == row.row_name), None)
+
+            # The row may have been invoiced since the planner ran
+            if payment_row and not payment_row.invoice_number:
+                lines.append((lease_docs[row.lease_contract], schedule_doc, payment_row))
+
+        if not lines:
+            return
+
+        if create_consolidated_invoice(lines, resolver, updates):
+            result.invoices += 1
+        else:
+            result.skipped += 1
+
+    except Exception as e:
+        frappe.log_error(e, f"Consolidated Invoice Error | Tenant: {billing_key[0]} | Date: {billing_key[2]}")
+        result.errors += 1
+
+    for schedule_name, schedule_updates in updates.items():
+        flush_schedule_updates(schedule_name, schedule_updates)
+        result.schedules += 1
+    frappe.db.commit()
+
+
+def get_pending_run_plan(today):
+    """Return today's persisted run plan with the indexes of its unfinished batches, if any."""
+    plan = frappe.db.get_global(RUN_PLAN_KEY)
+    if not plan:
+        return None
+
+    plan = json.loads(plan)
+    if plan["date"] != str(today):
+        return None
+
+    plan["batches"] = json.loads(frappe.db.get_value("Lease Billing Run", plan["run_id"], "run_plan") or "[]")
+    plan["pending"] = [
+        idx for idx in range(len(plan["batches"]))
+        if get_batch_checkpoint(plan["run_id"], idx) != CHECKPOINT_DONE
+    ]
+    return plan if plan["pending"] else None
+
+
+def save_run_plan(today, run_id):
+    previous = frappe.db.get_global(RUN_PLAN_KEY)
+    if previous:
+        previous = json.loads(previous)
+        batches = frappe.db.get_value("Lease Billing Run", previous["run_id"], "batches") or 0
+        for idx in range(batches):
+            frappe.defaults.clear_default(get_batch_checkpoint_key(previous["run_id"], idx), parent="__global")
+
+    frappe.db.set_global(RUN_PLAN_KEY, json.dumps({"date": str(today), "run_id": run_id}))
+    frappe.db.commit()
+
+
+def get_batch_checkpoint_key(run_id, batch_idx):
+    return f"{RUN_PLAN_KEY}|{run_id}|{batch_idx}"
+
+
+def get_batch_checkpoint(run_id, batch_idx):
+    return frappe.db.get_global(get_batch_checkpoint_key(run_id, batch_idx))
+
+
+def set_batch_checkpoint(run_id, batch_idx, lease_name):
+    frappe.db.set_global(get_batch_checkpoint_key(run_id, batch_idx), lease_name)
+
+
+@frappe.whitelist()
+def enqueue_lease_invoice_backfill(
+    from_date=None,
+    to_date=None,
+    company=None,
+    max_per_contract=DEFAULT_BACKFILL_MAX_PER_CONTRACT,
+    invoices_per_minute=DEFAULT_BACKFILL_INVOICES_PER_MINUTE,
+    time_budget=DEFAULT_BACKFILL_TIME_BUDGET,
+):
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "masar_mall.jobs.create_invoice.backfill_lease_invoices",
+        queue="long",
+        timeout=cint(time_budget) + 600,
+        from_date=from_date,
+        to_date=to_date,
+        company=company,
+        max_per_contract=max_per_contract,
+        invoices_per_minute=invoices_per_minute,
+        time_budget=time_budget,
+    )
+    frappe.msgprint("Lease invoice backfill has been queued.", alert=True, indicator="blue")
+
+
+def backfill_lease_invoices(
+    from_date=None,
+    to_date=None,
+    company=None,
+    max_per_contract=DEFAULT_BACKFILL_MAX_PER_CONTRACT,
+    invoices_per_minute=DEFAULT_BACKFILL_INVOICES_PER_MINUTE,
+    time_budget=DEFAULT_BACKFILL_TIME_BUDGET,
+):
+    """Invoice overdue schedule periods oldest first, without letting one contract or the
+    backlog as a whole monopolise the workers.
+
+    At most `max_per_contract` periods are invoiced per contract, invoice creation is held to
+    `invoices_per_minute`, and the run stops cleanly once `time_budget` seconds have passed.
+    """
+    to_date = getdate(to_date or nowdate())
+    from_date = getdate(from_date) if from_date else None
+    max_per_contract = cint(max_per_contract)
+    min_interval = 60.0 / flt(invoices_per_minute) if flt(invoices_per_minute) > 0 else 0
+    deadline = time.monotonic() + flt(time_budget) if flt(time_budget) > 0 else None
+
+    result = frappe._dict(dict.fromkeys(RUN_SUMMARY_FIELDS, 0), stopped_early=0)
+
+    with BillingRunLog(start_billing_run("Invoice Backfill"), result) as run_log:
+        with run_log.stage("select"):
+            due_rows = get_due_schedule_rows(to_date, from_date=from_date, company=company, include_ended=True)
+            due_rows.sort(key=lambda row: (row.lease_start, row.lease_contract))
+
+        selected = []
+        per_contract = {}
+        for row in due_rows:
+            if max_per_contract and per_contract.get(row.lease_contract, 0) >= max_per_contract:
                 continue
+            per_contract[row.lease_contract] = per_contract.get(row.lease_contract, 0) + 1
+            selected.append(row)
+
+        result.leases = len(per_contract)
+        selected_count = len(selected)
+        resolver = InvoiceReferenceResolver()
+        resolver.prefetch_items(list(per_contract))
+
+        # Lessors that consolidate tenant billing are billed exactly as the daily run bills them,
+        # one invoice per group, under the same throttle and time budget as the other periods
+        consolidated_rows = []
+        work = []
+        for row in selected:
+            if consolidates_tenant_billing(row.owner_lessor, resolver):
+                consolidated_rows.append(row)
+            else:
+                work.append((getdate(row.lease_start), row.lease_contract, None, row))
+        for billing_key, rows in group_consolidated_rows(consolidated_rows):
+            work.append((billing_key[2], rows[0].lease_contract, billing_key, rows))
+        work.sort(key=lambda item: (item[0], item[1]))
+
+        lease_docs = {}
+        schedule_docs = {}
+        updated_schedules = set()
+        last_invoice_at = None
+
+        for _posting_date, _lease_contract, billing_key, entry in work:
+            if deadline and time.monotonic() >= deadline:
+                result.stopped_early = 1
+                break
 
-            lease_doc = frappe.get_doc("Lease Contract", lease.name)
+            if min_interval and last_invoice_at is not None:
+                wait = min_interval - (time.monotonic() - last_invoice_at)
+                if wait > 0:
+                    time.sleep(wait)
 
-            if not lease_doc.owner_lessor:
-                frappe.log_error("Owner/Lessor not set", f"Lease Contract: {lease_doc.name}")
+            if billing_key:
+                last_invoice_at = time.monotonic()
+                bill_consolidated_group(billing_key, entry, resolver, result, lease_docs, schedule_docs)
                 continue
 
-            company_doc = frappe.get_doc("Company", lease_doc.owner_lessor)
+            row = entry
+            try:
+                if row.lease_contract not in lease_docs:
+                    lease_docs[row.lease_contract] = frappe.get_doc("Lease Contract", row.lease_contract)
+                if row.schedule not in schedule_docs:
+                    schedule_docs[row.schedule] = frappe.get_doc("Lease Contract Schedule", row.schedule)
 
-            schedules = frappe.get_all(
-                "Lease Contract Schedule",
-                filters={"lease_contract": lease_doc.name, "docstatus": 1},
-                fields=["name"]
-            )
+                lease_doc = lease_docs[row.lease_contract]
+                schedule_doc = schedule_docs[row.schedule]
+                payment_row = next((d for d in schedule_doc.invoice if d.name == row.row_name), None)
 
-            if not schedules:
-                frappe.log_error("No schedules found", f"Lease Contract: {lease_doc.name}")
-                continue
+                if not payment_row or payment_row.invoice_number:
+                    continue
 
-            for sched in schedules:
-                try:
-                    schedule_doc = frappe.get_doc("Lease Contract Schedule", sched.name)
+                last_invoice_at = time.monotonic()
+
+                invoice_name = create_rent_invoice(lease_doc, payment_row, schedule_doc, resolver)
+
+                if invoice_name:
+                    result.invoices += 1
+                    updated_schedules.add(row.schedule)
+                else:
+                    result.skipped += 1
+
+            except Exception as e:
+                frappe.log_error(e, f"Lease Invoice Backfill Error | Lease: {row.lease_contract} | Schedule: {row.schedule}")
+                result.errors += 1
+
+            frappe.db.commit()
+
+        result.schedules += len(updated_schedules)
+        resolver.log_stats("Lease Invoice Backfill")
+        run_log.flush(result)
+
+    frappe.logger().info(
+        f"Lease Invoice Backfill | {result.invoices} of {selected_count} selected periods invoiced across "
+        f"{result.leases} contracts, {result.skipped} skipped, {result.errors} errors"
+        + (" | stopped on time budget" if result.stopped_early else "")
+    )
+    return result
+
+
+def get_due_schedule_rows(today, lease_names=None, from_date=None, company=None, include_ended=False):
+    """Return the uninvoiced, non-allowance schedule rows that are due on `today` in one query.
+
+    `from_date` and `company` narrow the selection for backfill runs. With `include_ended`,
+    contracts that ended before `today` still have the rows due before their end selected, as
+    the daily run would have billed them on time.
+    """
+    conditions = []
+    if lease_names:
+        conditions.append("AND lc.name IN %(lease_names)s")
+    if from_date:
+        conditions.append("AND lci.lease_start >= %(from_date)s")
+    if company:
+        conditions.append("AND lc.owner_lessor = %(company)s")
+
+    return frappe.db.sql(f"""
+        SELECT
+            lc.name AS lease_contract,
+            lc.tenant_lessee,
+            lc.owner_lessor,
+            lcs.name AS schedule,
+            lci.name AS row_name,
+            lci.lease_start
+        FROM `tabLease Contract` lc
+        INNER JOIN `tabLease Contract Schedule` lcs
+            ON lcs.lease_contract = lc.name AND lcs.docstatus = 1
+        INNER JOIN `tabLease Contrant invoice` lci
+            ON lci.parent = lcs.name AND lci.parenttype = 'Lease Contract Schedule'
+        WHERE lc.status = 'Rent'
+            AND lc.docstatus = 1
+            AND (lc.lease_end IS NULL OR lc.lease_end >= {"lci.lease_start" if include_ended else "%(today)s"})
+            AND lci.is_allowance = 0
+            AND IFNULL(lci.invoice_number, '') = ''
+            AND lci.lease_start <= %(today)s
+            {" ".join(conditions)}
+        ORDER BY lc.name, lcs.name, lci.lease_start, lci.idx
+    """, {
+        "today": today,
+        "lease_names": tuple(lease_names or ()),
+        "from_date": from_date,
+        "company": company,
+    }, as_dict=True)
+
+
+def get_leases_with_due_services(today):
+    return frappe.db.sql("""
+        SELECT DISTINCT
+            lc.name AS lease_contract,
+            lc.tenant_lessee,
+            lc.owner_lessor
+        FROM `tabLease Contract` lc
+        INNER JOIN `tabOther Services Details` osd
+            ON osd.parent = lc.name AND osd.parenttype = 'Lease Contract'
+        WHERE lc.status = 'Rent'
+            AND lc.docstatus = 1
+            AND (lc.lease_end IS NULL OR lc.lease_end >= %(today)s)
+            AND IFNULL(osd.invoice_number, '') = ''
+            AND osd.invoice_date <= %(today)s
+    """, {"today": today}, as_dict=True)
+
+
+def group_due_rows(due_rows):
+    """Group planner rows as {lease_contract: {schedule: [row_name, ...]}}, keeping query order."""
+    due_by_lease = {}
+    for row in due_rows:
+        due_by_lease.setdefault(row.lease_contract, {}).setdefault(row.schedule, []).append(row.row_name)
+    return due_by_lease
+
+
+def process_lease(lease_name, due_schedules, today, resolver, result):
+    result.leases += 1
+
+    try:
+        lease_doc = frappe.get_doc("Lease Contract", lease_name)
 
-                    for row in schedule_doc.invoice:
+        if not lease_doc.owner_lessor:
+            log_skip("Owner/Lessor not set", f"Lease Contract: {lease_doc.name}")
+            result.skipped += 1
+            return
 
-                        if row.is_allowance or row.invoice_number:
-                            continue
+        for schedule_name, row_names in due_schedules.items():
+            updates = []
 
-                        if getdate(row.lease_start) > today:
-                            continue
+            try:
+                schedule_doc = frappe.get_doc("Lease Contract Schedule", schedule_name)
+                rows_by_name = {row.name: row for row in schedule_doc.invoice}
 
-                        if not lease_doc.contract_multi_period:
-                            create_individual_invoice(lease_doc, row, schedule_doc)
-                        else:
-                            create_multi_period_invoices(lease_doc, row, schedule_doc)
+                for row_name in row_names:
+                    row = rows_by_name.get(row_name)
 
-                except Exception as e:
-                    frappe.log_error(e, f"Schedule Processing Error | Lease: {lease_doc.name} | Schedule: {sched.name}")
-                    continue
+                    # The row may have been invoiced since the planner ran
+                    if not row or row.invoice_number:
+                        continue
 
-            if lease_doc.other_service:
-                for service in lease_doc.other_service:
                     try:
-                        if service.invoice_number:
-                            continue
-
-                        if not service.invoice_date or service.invoice_date > today:
-                            continue
-
-                        if not lease_doc.tenant_lessee:
-                            frappe.log_error("Tenant not set", f"Lease Contract: {lease_doc.name}")
-                            continue
-
-                        if not company_doc.default_receivable_account:
-                            frappe.log_error("Default Receivable Account missing", f"Company: {company_doc.name}")
-                            continue
-
-                        if not company_doc.default_income_account:
-                            frappe.log_error("Default Income Account missing", f"Company: {company_doc.name}")
-                            continue
-
-                        invoice = frappe.new_doc("Sales Invoice")
-                        invoice.customer = lease_doc.tenant_lessee
-                        invoice.set_posting_time = 1
-                        invoice.posting_date = str(service.invoice_date)
-                        invoice.due_date = str(service.invoice_date)
-                        invoice.custom_lease_contract = lease_doc.name
-                        invoice.debit_to = company_doc.default_receivable_account
-
-                        item_doc = frappe.get_doc("Item", service.service_item)
-                        service_rate = rounded(flt(service.rate), 6)
-
-                        invoice.append("items", {
-                            "item_code": service.service_item,
-                            "item_name": service.item_name or item_doc.item_name,
-                            "item_group": item_doc.item_group,
-                            "qty": 1,
-                            "rate": service_rate,
-                            "amount": service_rate,
-                            "uom": item_doc.stock_uom,
-                            "income_account": company_doc.default_income_account,
-                            "enable_deferred_revenue": 0,
-                            "service_start_date": service.invoice_date,
-                            "service_end_date": service.invoice_date,
-                        })
-
-                        setup_invoice_taxes(invoice, company_doc.name)
-                        invoice.insert(ignore_permissions=True)
-
-                        service.invoice_number = invoice.name
-                        service.db_update()
-
+                        invoice_name = create_rent_invoice(lease_doc, row, schedule_doc, resolver, updates)
                     except Exception as e:
-                        frappe.log_error(e, f"Other Service Invoice Error | Lease: {lease_doc.name}")
+                        frappe.log_error(e, f"Rent Invoice Error | Lease: {lease_doc.name} | Schedule: {schedule_name}")
+                        result.errors += 1
                         continue
 
-        except Exception as e:
-            frappe.log_error(e, f"Lease Processing Error | Lease: {lease.name}")
-            continue
+                    if invoice_name:
+                        result.invoices += 1
+                    else:
+                        result.skipped += 1
+
+            except Exception as e:
+                frappe.log_error(e, f"Schedule Processing Error | Lease: {lease_doc.name} | Schedule: {schedule_name}")
+                result.errors += 1
+
+            # Write back whatever was invoiced, even if a later row failed, and commit it
+            # together with the invoices and their ledger entries
+            flush_schedule_updates(schedule_name, updates)
+            if updates:
+                result.schedules += 1
+            frappe.db.commit()
+
+        due_services = [
+            service for service in lease_doc.other_service or []
+            if not service.invoice_number
+            and service.invoice_date
+            and getdate(service.invoice_date) <= today
+        ]
+
+        for services in group_service_invoices(lease_doc, due_services, resolver):
+            try:
+                if create_service_invoice(lease_doc, services, resolver):
+                    result.invoices += 1
+                else:
+                    result.skipped += 1
+
+            except Exception as e:
+                frappe.log_error(e, f"Other Service Invoice Error | Lease: {lease_doc.name}")
+                result.errors += 1
 
+            frappe.db.commit()
+
+    except Exception as e:
+        frappe.log_error(e, f"Lease Processing Error | Lease: {lease_name}")
+        result.errors += 1
+
+
+def group_service_invoices(lease_doc, services, resolver):
+    """Split due service rows into the invoices to create: one per row, or one per
+    `invoice_date` when the company consolidates other services."""
+    company_doc = resolver.get_company(lease_doc.owner_lessor)
+    if not company_doc.custom_consolidate_other_services:
+        return [[service] for service in services]
+
+    groups = {}
+    for service in services:
+        groups.setdefault(getdate(service.invoice_date), []).append(service)
+    return [groups[invoice_date] for invoice_date in sorted(groups)]
+
+
+def create_service_invoice(lease_doc, services, resolver=None):
+    """Create one Sales Invoice with a line per service row; all rows share an `invoice_date`."""
+    resolver = resolver or InvoiceReferenceResolver()
+    frappe.db.savepoint("lease_invoice")
 
-def create_individual_invoice(lease_doc, payment_row, schedule_doc):
     try:
         if not lease_doc.tenant_lessee:
-            frappe.log_error("Tenant not set", f"Lease Contract: {lease_doc.name}")
+            log_skip("Tenant not set", f"Lease Contract: {lease_doc.name}")
             return
 
-        company_doc = frappe.get_doc("Company", lease_doc.owner_lessor)
+        company_doc = resolver.get_company(lease_doc.owner_lessor)
 
-        if not company_doc.default_receivable_account or not company_doc.default_income_account:
-            frappe.log_error("Company accounts missing", f"Company: {company_doc.name}")
+        if not company_doc.default_receivable_account:
+            log_skip("Default Receivable Account missing", f"Company: {company_doc.name}")
             return
 
-        invoice = frappe.new_doc("Sales Invoice")
-        invoice.customer = lease_doc.tenant_lessee
-        invoice.set_posting_time = 1
-        invoice.posting_date = str(payment_row.lease_start)
-        invoice.due_date = str(payment_row.lease_end)
-        invoice.custom_lease_contract = lease_doc.name
-        invoice.debit_to = company_doc.default_receivable_account
-
-        item_codes = frappe.get_all(
-            "Lease Contract Details",
-            filters={"parent": lease_doc.name, "amount": (">", 0)},
-            fields=["rent_item", "amount"]
-        )
+        if not company_doc.default_income_account:
+            log_skip("Default Income Account missing", f"Company: {company_doc.name}")
+            return
+
+        pending = []
+        invoice_name = None
+        for service in services:
+            existing_invoice = repair_from_ledger(service)
+            if existing_invoice:
+                service.db_update()
+                invoice_name = existing_invoice.name
+            else:
+                pending.append(service)
+
+        if not pending:
+            return invoice_name
+
+        invoice_date = pending[0].invoice_date
+
+        with billing_stage("build"):
+            invoice = new_lease_invoice(lease_doc.tenant_lessee, invoice_date, invoice_date, lease_doc.name, company_doc)
+
+            for service in pending:
+                item_doc = resolver.get_item(service.service_item)
+                service_rate = rounded(flt(service.rate), 6)
+
+                invoice.append("items", {
+                    "item_code": service.service_item,
+                    "item_name": service.item_name or item_doc.item_name,
+                    "item_group": item_doc.item_group,
+                    "qty": 1,
+                    "rate": service_rate,
+                    "amount": service_rate,
+                    "uom": item_doc.stock_uom,
+                    "income_account": company_doc.default_income_account,
+                    "enable_deferred_revenue": 0,
+                    "service_start_date": service.invoice_date,
+                    "service_end_date": service.invoice_date,
+                })
+
+            setup_invoice_taxes(invoice, company_doc.name, resolver)
+
+        with billing_stage("insert"):
+            invoice.insert(ignore_permissions=True)
 
-        if not item_codes:
-            frappe.log_error("No billable items", f"Lease Contract: {lease_doc.name}")
+        for service in pending:
+            record_ledger_entry(get_idempotency_key(service), invoice.name, lease_doc.name, service)
+            service.invoice_number = invoice.name
+            service.db_update()
+
+        return invoice.name
+
+    except Exception:
+        frappe.db.rollback(save_point="lease_invoice")
+        raise
+
+
+def create_rent_invoice(lease_doc, payment_row, schedule_doc, resolver=None, updates=None):
+    """Create the Sales Invoice of one schedule row, with the rates of a single- or multi-period
+    contract as the contract requires."""
+    resolver = resolver or InvoiceReferenceResolver()
+
+    try:
+        frappe.db.savepoint("lease_invoice")
+
+        if not lease_doc.tenant_lessee:
+            log_skip("Tenant not set", f"Lease Contract: {lease_doc.name}")
             return
 
-        total_months = rounded(
-            flt(getattr(lease_doc, "period_in_months", 0)) /
-            flt(getattr(lease_doc, "billing_frequency", 1)),
-            6
-        )
+        existing_invoice = repair_from_ledger(payment_row)
+        if existing_invoice:
+            queue_schedule_update(schedule_doc, payment_row, existing_invoice, updates)
+            return existing_invoice.name
 
-        if lease_doc.allowance_period and lease_doc.in_period:
-            total_months -= flt(lease_doc.allowance_period)
-
-        for item in item_codes:
-            item_doc = frappe.get_doc("Item", item.rent_item)
-            item_rate = rounded(flt(item.amount) / total_months, 6)
-
-            invoice.append("items", {
-                "item_code": item.rent_item,
-                "item_name": item_doc.item_name,
-                "item_group": item_doc.item_group,
-                "qty": 1,
-                "rate": item_rate,
-                "uom": item_doc.stock_uom,
-                "income_account": company_doc.default_income_account,
-                "enable_deferred_revenue": 1,
-                "service_start_date": payment_row.lease_start,
-                "service_end_date": payment_row.lease_end,
-            })
-
-        setup_invoice_taxes(invoice, company_doc.name)
-        invoice.insert(ignore_permissions=True)
+        company_doc = resolver.get_company(lease_doc.owner_lessor)
+
+        if not company_doc.default_receivable_account or not company_doc.default_income_account:
+            log_skip("Company accounts missing", f"Company: {company_doc.name}")
+            return
+
+        rates = get_rent_invoice_rates(lease_doc, payment_row)
+        if not rates:
+            return
+
+        with billing_stage("build"):
+            invoice = new_lease_invoice(
+                lease_doc.tenant_lessee, payment_row.lease_start, payment_row.lease_end, lease_doc.name, company_doc
+            )
+            append_rent_items(invoice, rates, payment_row, company_doc, resolver)
+            setup_invoice_taxes(invoice, company_doc.name, resolver)
+
+        with billing_stage("insert"):
+            invoice.insert(ignore_permissions=True)
+            record_ledger_entry(get_idempotency_key(payment_row), invoice.name, lease_doc.name, payment_row)
 
         payment_row.invoice_number = invoice.name
         payment_row.invoice_status = invoice.status
-        schedule_doc.save(ignore_permissions=True)
+        queue_schedule_update(schedule_doc, payment_row, invoice, updates)
 
-    except Exception as e:
-        frappe.log_error(e, f"Individual Invoice Error | Lease: {lease_doc.name}")
+        return invoice.name
 
+    except Exception:
+        frappe.db.rollback(save_point="lease_invoice")
+        raise
+
+
+def create_consolidated_invoice(lines, resolver=None, updates=None):
+    """Create one Sales Invoice for `(lease_doc, schedule_doc, payment_row)` lines that share a
+    tenant, lessor and posting date. Every item keeps its contract in `custom_lease_contract`
+    and every row gets the invoice number; `updates` collects the write-backs per schedule."""
+    resolver = resolver or InvoiceReferenceResolver()
+    updates = {} if updates is None else updates
+    first_lease = lines[0][0]
+
+    frappe.db.savepoint("lease_invoice")
 
-def create_multi_period_invoices(lease_doc, payment_row, schedule_doc):
     try:
-        if not lease_doc.tenant_lessee:
-            frappe.log_error("Tenant not set", f"Lease Contract: {lease_doc.name}")
+        if not first_lease.tenant_lessee:
+            log_skip("Tenant not set", f"Lease Contract: {first_lease.name}")
             return
 
-        company_doc = frappe.get_doc("Company", lease_doc.owner_lessor)
+        company_doc = resolver.get_company(first_lease.owner_lessor)
 
         if not company_doc.default_receivable_account or not company_doc.default_income_account:
-            frappe.log_error("Company accounts missing", f"Company: {company_doc.name}")
+            log_skip("Company accounts missing", f"Company: {company_doc.name}")
             return
 
-        invoice = frappe.new_doc("Sales Invoice")
-        invoice.customer = lease_doc.tenant_lessee
-        invoice.set_posting_time = 1
-        invoice.posting_date = str(payment_row.lease_start)
-        invoice.due_date = str(payment_row.lease_end)
-        invoice.custom_lease_contract = lease_doc.name
-        invoice.debit_to = company_doc.default_receivable_account
-
-        period = None
-        for p in lease_doc.period_details:
-            if getdate(p.from_date) <= getdate(payment_row.lease_start) <= getdate(p.to_date):
-                period = p
-                break
+        pending = []
+        invoice_name = None
+        for lease_doc, schedule_doc, payment_row in lines:
+            existing_invoice = repair_from_ledger(payment_row)
+            if existing_invoice:
+                updates.setdefault(schedule_doc.name, []).append(
+                    (payment_row.name, existing_invoice.name, existing_invoice.status)
+                )
+                invoice_name = existing_invoice.name
+            else:
+                pending.append((lease_doc, schedule_doc, payment_row))
+
+        if not pending:
+            return invoice_name
+
+        with billing_stage("build"):
+            invoice = new_lease_invoice(
+                first_lease.tenant_lessee,
+                pending[0][2].lease_start,
+                min(getdate(line[2].lease_end) for line in pending),
+                pending[0][0].name,
+                company_doc,
+            )
 
-        if not period:
-            frappe.log_error("No matching period", f"Lease: {lease_doc.name} | Date: {payment_row.lease_start}")
-            return
+            billed = []
+            for lease_doc, schedule_doc, payment_row in pending:
+                rates = get_rent_invoice_rates(lease_doc, payment_row)
+                if not rates:
+                    continue
 
-        period_months = flt(period.month_in_period)
-        if lease_doc.allowance_period and lease_doc.in_period and period == lease_doc.period_details[0]:
-            period_months -= flt(lease_doc.allowance_period)
+                append_rent_items(invoice, rates, payment_row, company_doc, resolver, lease_contract=lease_doc.name)
+                billed.append((lease_doc, schedule_doc, payment_row))
+
+            if not billed:
+                return invoice_name
 
-        service_rent_monthly = rounded(flt(period.service_amount) / period_months, 6)
-        space_rent_monthly = rounded(flt(period.space_amount) / period_months, 6)
+            setup_invoice_taxes(invoice, company_doc.name, resolver)
 
-        for rent_item in lease_doc.rent_details:
-            if rent_item.amount <= 0:
-                continue
+        with billing_stage("insert"):
+            invoice.insert(ignore_permissions=True)
 
-            item_doc = frappe.get_doc("Item", rent_item.rent_item)
-            monthly_rate = space_rent_monthly if rent_item.is_stock_item else service_rent_monthly
-            invoice_rate = rounded(monthly_rate * flt(lease_doc.billing_frequency), 6)
-
-            invoice.append("items", {
-                "item_code": rent_item.rent_item,
-                "item_name": item_doc.item_name,
-                "item_group": item_doc.item_group,
-                "qty": 1,
-                "rate": invoice_rate,
-                "uom": item_doc.stock_uom,
-                "income_account": company_doc.default_income_account,
-                "enable_deferred_revenue": 1,
-                "service_start_date": payment_row.lease_start,
-                "service_end_date": payment_row.lease_end,
-            })
-
-        setup_invoice_taxes(invoice, company_doc.name)
-        invoice.insert(ignore_permissions=True)
+        for lease_doc, schedule_doc, payment_row in billed:
+            record_ledger_entry(get_idempotency_key(payment_row), invoice.name, lease_doc.name, payment_row)
 
-        payment_row.invoice_number = invoice.name
-        payment_row.invoice_status = invoice.status
-        schedule_doc.save(ignore_permissions=True)
+        for lease_doc, schedule_doc, payment_row in billed:
+            payment_row.invoice_number = invoice.name
+            payment_row.invoice_status = invoice.status
+            updates.setdefault(schedule_doc.name, []).append((payment_row.name, invoice.name, invoice.status))
 
-    except Exception as e:
-        frappe.log_error(e, f"Multi Period Invoice Error | Lease: {lease_doc.name}")
+        return invoice.name
 
+    except Exception:
+        frappe.db.rollback(save_point="lease_invoice")
+        raise
 
-def setup_invoice_taxes(invoice, company):
-    try:
-        cost_center = frappe.get_cached_value("Company", company, "cost_center")
-
-        tax_accounts = [
-            {
-                "account_head": "220000003 - VAT - BM",
-                "description": "VAT",
-                "rate": 0,
-            },
-            {
-                "account_head": "2210000001 - VAT 0 - BM",
-                "description": "VAT 0",
-                "rate": 0,
-            }
-        ]
 
-        for tax in tax_accounts:
-            invoice.append("taxes", {
-                "charge_type": "On Net Total",
-                "account_head": tax["account_head"],
-                "description": tax["description"],
-                "rate": tax["rate"],
-                "included_in_print_rate": 0,
-                "cost_center": cost_center
-            })
+def repair_from_ledger(row):
+    """Return the invoice the ledger holds for `row`, copied onto the row, if an earlier run
+    created it and died before the write-back."""
+    existing_invoice = get_ledger_invoice(get_idempotency_key(row))
+    if existing_invoice:
+        row.invoice_number = existing_invoice.name
+        row.invoice_status = existing_invoice.status
+    return existing_invoice
+
+
+def new_lease_invoice(customer, posting_date, due_date, lease_contract, company_doc):
+    invoice = frappe.new_doc("Sales Invoice")
+    invoice.customer = customer
+    invoice.set_posting_time = 1
+    invoice.posting_date = str(posting_date)
+    invoice.due_date = str(due_date)
+    invoice.custom_lease_contract = lease_contract
+    invoice.debit_to = company_doc.default_receivable_account
+    return invoice
+
+
+def get_rent_invoice_rates(lease_doc, payment_row):
+    """The `[(rent_item, rate)]` billed on `payment_row`, or None (logged) when nothing is billable."""
+    if lease_doc.contract_multi_period:
+        rates = get_multi_period_invoice_rates(lease_doc, payment_row.lease_start)
+        if rates is None:
+            log_skip("No matching period", f"Lease: {lease_doc.name} | Date: {payment_row.lease_start}")
+            return None
+    else:
+        rates = get_individual_invoice_rates(lease_doc)
+
+    if not rates:
+        log_skip("No billable items", f"Lease: {lease_doc.name} | Date: {payment_row.lease_start}")
+        return None
+
+    return rates
+
+
+def append_rent_items(invoice, rates, payment_row, company_doc, resolver, lease_contract=None):
+    """One deferred-revenue line per `(rent_item, rate)` covering the schedule row's dates."""
+    for rent_item, rate in rates:
+        item_doc = resolver.get_item(rent_item)
+
+        item = {
+            "item_code": rent_item,
+            "item_name": item_doc.item_name,
+            "item_group": item_doc.item_group,
+            "qty": 1,
+            "rate": rate,
+            "uom": item_doc.stock_uom,
+            "income_account": company_doc.default_income_account,
+            "enable_deferred_revenue": 1,
+            "service_start_date": payment_row.lease_start,
+            "service_end_date": payment_row.lease_end,
+        }
+        if lease_contract:
+            item["custom_lease_contract"] = lease_contract
+
+        invoice.append("items", item)
+
+
+def get_individual_invoice_rates(lease_doc):
+    """Return `[(rent_item, rate)]` billed on every period of a single-period contract."""
+    rent_items = [d for d in lease_doc.rent_details if flt(d.amount) > 0]
+    if not rent_items:
+        return []
+
+    total_months = rounded(
+        flt(getattr(lease_doc, "period_in_months", 0)) /
+        flt(getattr(lease_doc, "billing_frequency", 1)),
+        6
+    )
+
+    if lease_doc.allowance_period and lease_doc.in_period:
+        total_months -= flt(lease_doc.allowance_period)
+
+    return [(d.rent_item, rounded(flt(d.amount) / total_months, 6)) for d in rent_items]
+
+
+def get_multi_period_invoice_rates(lease_doc, lease_start):
+    """Return `[(rent_item, rate)]` for the contract period covering `lease_start`,
+    or None when no period covers it."""
+    lease_start = getdate(lease_start)
+
+    period_idx = None
+    for idx, p in enumerate(lease_doc.period_details):
+        if getdate(p.from_date) <= lease_start <= getdate(p.to_date):
+            period_idx = idx
+            break
+
+    if period_idx is None:
+        return None
+
+    period = lease_doc.period_details[period_idx]
+    period_months = flt(period.month_in_period)
+    if lease_doc.allowance_period and lease_doc.in_period and period_idx == 0:
+        period_months -= flt(lease_doc.allowance_period)
+
+    service_rent_monthly = rounded(flt(period.service_amount) / period_months, 6)
+    space_rent_monthly = rounded(flt(period.space_amount) / period_months, 6)
+
+    rates = []
+    for rent_item in lease_doc.rent_details:
+        if flt(rent_item.amount) <= 0:
+            continue
+
+        monthly_rate = space_rent_monthly if rent_item.is_stock_item else service_rent_monthly
+        rates.append((rent_item.rent_item, rounded(monthly_rate * flt(lease_doc.billing_frequency), 6)))
+
+    return rates
+
+
+def queue_schedule_update(schedule_doc, payment_row, invoice, updates=None):
+    """Collect the row write-back, or flush it straight away when the caller keeps no batch."""
+    update = (payment_row.name, invoice.name, invoice.status)
+
+    if updates is None:
+        flush_schedule_updates(schedule_doc.name, [update])
+    else:
+        updates.append(update)
+
+
+def flush_schedule_updates(schedule_name, updates):
+    """Write `(row name, invoice name, status)` triples to the schedule rows in one UPDATE
+    and refresh the schedule's period counters."""
+    if not updates:
+        return
+
+    with billing_stage("write_back"):
+        number_cases = " ".join(["WHEN %s THEN %s"] * len(updates))
+        values = []
+        for row_name, invoice_name, _status in updates:
+            values += [row_name, invoice_name]
+        for row_name, _invoice_name, status in updates:
+            values += [row_name, status]
+        values += [schedule_name] + [update[0] for update in updates]
+
+        frappe.db.sql(f"""
+            UPDATE `tabLease Contrant invoice`
+            SET
+                invoice_number = CASE name {number_cases} END,
+                invoice_status = CASE name {number_cases} END
+            WHERE parent = %s
+                AND parenttype = 'Lease Contract Schedule'
+                AND name IN ({", ".join(["%s"] * len(updates))})
+        """, values)
+
+        refresh_schedule_counters([schedule_name])
+
+
+def setup_invoice_taxes(invoice, company, resolver=None):
+    resolver = resolver or InvoiceReferenceResolver()
+
+    try:
+        for tax in resolver.get_tax_rows(company):
+            invoice.append("taxes", dict(tax))
 
     except Exception as e:
         frappe.log_error(e, f"Invoice Tax Setup Error | Company: {company}")
@@ -0,0 +1,47 @@
+import frappe
+from masar_mall.jobs.invoice_task import apply_invoice_statuses
+
+
+def sales_invoice_status_changed(doc, method=None):
+    if doc.get("custom_lease_contract"):
+        queue_invoice_status_sync([doc.name])
+
+
+def payment_entry_changed(doc, method=None):
+    queue_invoice_status_sync([
+        ref.reference_name for ref in doc.references
+        if ref.reference_doctype == "Sales Invoice"
+    ])
+
+
+def queue_invoice_status_sync(invoice_names):
+    """Collect invoices whose status changed in this transaction and push their statuses to the
+    lease schedules once, just before commit, so a Payment Entry against many invoices costs one
+    update per schedule instead of one per invoice."""
+    if not invoice_names:
+        return
+
+    if frappe.flags.lease_invoice_status_sync is None:
+        frappe.flags.lease_invoice_status_sync = set()
+        frappe.db.before_commit.add(flush_invoice_status_sync)
+        frappe.db.after_rollback.add(clear_invoice_status_sync)
+
+    frappe.flags.lease_invoice_status_sync.update(invoice_names)
+
+
+def flush_invoice_status_sync():
+    invoice_names = frappe.flags.pop("lease_invoice_status_sync", None)
+    if not invoice_names:
+        return
+
+    statuses = dict(frappe.get_all(
+        "Sales Invoice",
+        filters={"name": ("in", list(invoice_names)), "custom_lease_contract": ("is", "set")},
+        fields=["name", "status"],
+        as_list=True
+    ))
+    apply_invoice_statuses(statuses)
+
+
+def clear_invoice_status_sync():
+    frappe.flags.pop("lease_invoice_status_sync", None)
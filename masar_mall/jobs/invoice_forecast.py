@@ -0,0 +1,334 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import csv
+import io
+from itertools import islice
+
+import frappe
+from frappe.utils import getdate, flt, rounded
+from masar_mall.jobs.create_invoice import (
+    consolidates_tenant_billing,
+    get_individual_invoice_rates,
+    get_multi_period_invoice_rates,
+    group_service_invoices,
+)
+from masar_mall.jobs.invoice_resolver import InvoiceReferenceResolver
+
+
+FORECAST_CHUNK_SIZE = 500
+FORECAST_PAGE_LENGTH = 500
+
+FORECAST_COLUMNS = [
+    "lease_contract",
+    "customer",
+    "company",
+    "invoice_type",
+    "reference_row",
+    "posting_date",
+    "due_date",
+    "item_code",
+    "item_name",
+    "rate",
+    "invoice_total",
+]
+
+
+@frappe.whitelist()
+def get_invoice_forecast(from_date, to_date, company=None, as_csv=0, start=0, page_length=FORECAST_PAGE_LENGTH):
+    """Read-only preview of the Sales Invoices the invoice job would create between two dates,
+    `page_length` invoices from `start` at a time. With `as_csv` the full forecast is exported
+    by a background job instead and the file is attached when it finishes."""
+    frappe.has_permission("Lease Contract", "read", throw=True)
+
+    if frappe.utils.cint(as_csv):
+        frappe.enqueue(
+            "masar_mall.jobs.invoice_forecast.export_invoice_forecast",
+            queue="long",
+            timeout=7200,
+            from_date=from_date,
+            to_date=to_date,
+            company=company,
+        )
+        frappe.msgprint("Lease invoice forecast export has been queued.", alert=True, indicator="blue")
+        return
+
+    start = frappe.utils.cint(start)
+    page_length = frappe.utils.cint(page_length) or FORECAST_PAGE_LENGTH
+    return list(islice(iter_invoice_forecast(from_date, to_date, company), start, start + page_length))
+
+
+def export_invoice_forecast(from_date, to_date, company=None):
+    """Write the forecast CSV chunk by chunk to a private file and send the user its link."""
+    file_name = f"lease_invoice_forecast_{from_date}_{to_date}_{frappe.utils.now_datetime().strftime('%Y%m%d%H%M%S')}.csv"
+
+    with open(frappe.get_site_path("private", "files", file_name), "w", newline="") as stream:
+        for chunk in iter_forecast_csv(iter_invoice_forecast(from_date, to_date, company)):
+            stream.write(chunk)
+
+    forecast_file = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "file_url": f"/private/files/{file_name}",
+        "is_private": 1,
+    })
+    forecast_file.save(ignore_permissions=True)
+    frappe.db.commit()
+
+    frappe.publish_realtime(
+        "msgprint",
+        f"Lease invoice forecast for {from_date} to {to_date} is ready. "
+        f"<a href='{forecast_file.file_url}'>Download the forecast</a>",
+        user=frappe.session.user,
+    )
+
+
+def iter_invoice_forecast(from_date, to_date, company=None, chunk_size=FORECAST_CHUNK_SIZE):
+    """Yield every invoice the job would create for uninvoiced periods and services dated
+    between `from_date` and `to_date`, as plain dicts, using the job's own rate logic.
+
+    Contracts are loaded `chunk_size` at a time with a few set-based queries, so memory stays
+    flat however long the range is.
+    """
+    from_date = getdate(from_date)
+    to_date = getdate(to_date)
+
+    for chunk in chunk_by_tenant(get_forecast_leases(from_date, to_date, company), chunk_size):
+        leases = load_forecast_leases(chunk)
+
+        resolver = InvoiceReferenceResolver()
+        resolver.prefetch_items(chunk)
+
+        # Lessors that consolidate tenant billing get one invoice per tenant and posting date
+        # across contracts, like process_consolidated_rows
+        consolidated = {}
+        for row in get_forecast_schedule_rows(chunk, from_date, to_date):
+            lease = leases[row.lease_contract]
+
+            if lease.contract_multi_period:
+                rates = get_multi_period_invoice_rates(lease, row.lease_start)
+            else:
+                rates = get_individual_invoice_rates(lease)
+
+            if not rates:
+                continue
+
+            lines = [(item_code, None, rate) for item_code, rate in rates]
+            if consolidates_tenant_billing(lease.owner_lessor, resolver) and lease.tenant_lessee:
+                key = (lease.tenant_lessee, lease.owner_lessor, getdate(row.lease_start))
+                consolidated.setdefault(key, []).append((lease, row, lines))
+                continue
+
+            yield make_forecast_invoice(
+                lease, "Rent", [row.name], row.lease_start, row.lease_end, lines, resolver
+            )
+
+        for key in sorted(consolidated):
+            group = consolidated[key]
+            yield make_forecast_invoice(
+                group[0][0], "Rent", [row.name for _, row, _ in group], key[2],
+                min(getdate(row.lease_end) for _, row, _ in group),
+                [line for _, _, lines in group for line in lines], resolver
+            )
+
+        services_by_lease = {}
+        for service in get_forecast_services(chunk, from_date, to_date):
+            services_by_lease.setdefault(service.lease_contract, []).append(service)
+
+        for lease_name, services in services_by_lease.items():
+            lease = leases[lease_name]
+            for group in group_service_invoices(lease, services, resolver):
+                lines = [(service.service_item, service.item_name, rounded(flt(service.rate), 6)) for service in group]
+                yield make_forecast_invoice(
+                    lease, "Other Service", [service.name for service in group],
+                    group[0].invoice_date, group[0].invoice_date, lines, resolver
+                )
+
+
+def iter_forecast_csv(invoices, lines_per_chunk=1000):
+    """Turn forecast invoices into CSV text chunks, one line per invoice item."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FORECAST_COLUMNS)
+    lines = 0
+
+    for invoice in invoices:
+        for item in invoice["items"]:
+            writer.writerow([
+                invoice["lease_contract"],
+                invoice["customer"],
+                invoice["company"],
+                invoice["invoice_type"],
+                invoice["reference_row"],
+                invoice["posting_date"],
+                invoice["due_date"],
+                item["item_code"],
+                item["item_name"],
+                item["rate"],
+                invoice["total"],
+            ])
+            lines += 1
+
+        if lines >= lines_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            lines = 0
+
+    yield buffer.getvalue()
+
+
+def make_forecast_invoice(lease, invoice_type, reference_rows, posting_date, due_date, lines, resolver):
+    """One forecast invoice from `lines` of (item_code, item_name, rate); a missing item name
+    falls back to the Item's."""
+    items = []
+    for item_code, item_name, rate in lines:
+        item = resolver.items.get(item_code)
+        items.append({
+            "item_code": item_code,
+            "item_name": item_name or (item.item_name if item else item_code),
+            "rate": rate,
+        })
+
+    return {
+        "lease_contract": lease.name,
+        "customer": lease.tenant_lessee,
+        "company": lease.owner_lessor,
+        "invoice_type": invoice_type,
+        "reference_row": ", ".join(reference_rows),
+        "posting_date": str(posting_date),
+        "due_date": str(due_date),
+        "items": items,
+        "total": rounded(sum(flt(item["rate"]) for item in items), 6),
+    }
+
+
+def get_forecast_leases(from_date, to_date, company=None):
+    company_condition = "AND lc.owner_lessor = %(company)s" if company else ""
+
+    return frappe.db.sql(f"""
+        SELECT lc.name, lc.tenant_lessee
+        FROM `tabLease Contract` lc
+        WHERE lc.status = 'Rent'
+            AND lc.docstatus = 1
+            {company_condition}
+            AND (
+                EXISTS (
+                    SELECT 1
+                    FROM `tabLease Contract Schedule` lcs
+                    INNER JOIN `tabLease Contrant invoice` lci
+                        ON lci.parent = lcs.name AND lci.parenttype = 'Lease Contract Schedule'
+                    WHERE lcs.lease_contract = lc.name
+                        AND lcs.docstatus = 1
+                        AND lci.is_allowance = 0
+                        AND IFNULL(lci.invoice_number, '') = ''
+                        AND lci.lease_start BETWEEN %(from_date)s AND %(to_date)s
+                        AND (lc.lease_end IS NULL OR lci.lease_start <= lc.lease_end)
+                )
+                OR EXISTS (
+                    SELECT 1
+                    FROM `tabOther Services Details` osd
+                    WHERE osd.parent = lc.name
+                        AND osd.parenttype = 'Lease Contract'
+                        AND IFNULL(osd.invoice_number, '') = ''
+                        AND osd.invoice_date BETWEEN %(from_date)s AND %(to_date)s
+                        AND (lc.lease_end IS NULL OR osd.invoice_date <= lc.lease_end)
+                )
+            )
+        ORDER BY lc.tenant_lessee, lc.name
+    """, {"from_date": from_date, "to_date": to_date, "company": company}, as_dict=True)
+
+
+def chunk_by_tenant(leases, chunk_size):
+    """Lease names in chunks of about `chunk_size`, never splitting one tenant's contracts, so
+    consolidated invoices see all of them. `leases` must be ordered by tenant."""
+    chunk = []
+    for idx, lease in enumerate(leases):
+        chunk.append(lease.name)
+        next_lease = leases[idx + 1] if idx + 1 < len(leases) else None
+        if len(chunk) >= chunk_size and (not next_lease or next_lease.tenant_lessee != lease.tenant_lessee):
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def load_forecast_leases(lease_names):
+    """Load the contract fields and child rows the rate functions read, without building documents."""
+    leases = {
+        lease.name: lease
+        for lease in frappe.get_all(
+            "Lease Contract",
+            filters={"name": ("in", lease_names)},
+            fields=[
+                "name", "tenant_lessee", "owner_lessor", "period_in_months", "billing_frequency",
+                "allowance_period", "in_period", "contract_multi_period",
+            ]
+        )
+    }
+
+    for lease in leases.values():
+        lease.rent_details = []
+        lease.period_details = []
+
+    for row in frappe.get_all(
+        "Lease Contract Details",
+        filters={"parent": ("in", lease_names), "parenttype": "Lease Contract"},
+        fields=["parent", "rent_item", "amount", "is_stock_item"],
+        order_by="parent, idx"
+    ):
+        leases[row.parent].rent_details.append(row)
+
+    for row in frappe.get_all(
+        "Lease Contract Period Details",
+        filters={"parent": ("in", lease_names), "parenttype": "Lease Contract"},
+        fields=["parent", "from_date", "to_date", "month_in_period", "space_amount", "service_amount"],
+        order_by="parent, idx"
+    ):
+        leases[row.parent].period_details.append(row)
+
+    return leases
+
+
+def get_forecast_schedule_rows(lease_names, from_date, to_date):
+    # The job only bills contracts whose lease_end is on or after the run date, so a row due
+    # after its contract ends (an out-of-period allowance shift) is never invoiced
+    return frappe.db.sql("""
+        SELECT
+            lcs.lease_contract,
+            lci.name,
+            lci.lease_start,
+            lci.lease_end
+        FROM `tabLease Contract Schedule` lcs
+        INNER JOIN `tabLease Contract` lc ON lc.name = lcs.lease_contract
+        INNER JOIN `tabLease Contrant invoice` lci
+            ON lci.parent = lcs.name AND lci.parenttype = 'Lease Contract Schedule'
+        WHERE lcs.lease_contract IN %(leases)s
+            AND lcs.docstatus = 1
+            AND lci.is_allowance = 0
+            AND IFNULL(lci.invoice_number, '') = ''
+            AND lci.lease_start BETWEEN %(from_date)s AND %(to_date)s
+            AND (lc.lease_end IS NULL OR lci.lease_start <= lc.lease_end)
+        ORDER BY lcs.lease_contract, lci.lease_start, lci.idx
+    """, {"leases": tuple(lease_names), "from_date": from_date, "to_date": to_date}, as_dict=True)
+
+
+def get_forecast_services(lease_names, from_date, to_date):
+    return frappe.db.sql("""
+        SELECT
+            osd.parent AS lease_contract,
+            osd.name,
+            osd.service_item,
+            osd.item_name,
+            osd.rate,
+            osd.invoice_date
+        FROM `tabOther Services Details` osd
+        INNER JOIN `tabLease Contract` lc ON lc.name = osd.parent
+        WHERE osd.parent IN %(leases)s
+            AND osd.parenttype = 'Lease Contract'
+            AND IFNULL(osd.invoice_number, '') = ''
+            AND osd.invoice_date BETWEEN %(from_date)s AND %(to_date)s
+            AND (lc.lease_end IS NULL OR osd.invoice_date <= lc.lease_end)
+        ORDER BY osd.parent, osd.invoice_date, osd.idx
+    """, {"leases": tuple(lease_names), "from_date": from_date, "to_date": to_date}, as_dict=True)
@@ -0,0 +1,38 @@
+import frappe
+
+
+def get_idempotency_key(row):
+    """One key per billable child row, e.g. a schedule period or an other-service line."""
+    return f"{row.doctype}|{row.name}"
+
+
+def get_ledger_invoice(key):
+    """Return the live Sales Invoice already created for `key`, dropping entries whose invoice was cancelled."""
+    entry = frappe.db.sql("""
+        SELECT si.name, si.status, si.docstatus
+        FROM `tabLease Invoice Ledger` ledger
+        LEFT JOIN `tabSales Invoice` si ON si.name = ledger.sales_invoice
+        WHERE ledger.name = %s
+    """, (key,), as_dict=True)
+
+    if not entry:
+        return None
+
+    if not entry[0].name or entry[0].docstatus == 2:
+        frappe.db.delete("Lease Invoice Ledger", {"name": key})
+        return None
+
+    return entry[0]
+
+
+def record_ledger_entry(key, invoice_name, lease_contract, row):
+    """Claim `key` for `invoice_name`; the unique key makes a second claim fail with DuplicateEntryError."""
+    frappe.get_doc({
+        "doctype": "Lease Invoice Ledger",
+        "idempotency_key": key,
+        "sales_invoice": invoice_name,
+        "lease_contract": lease_contract,
+        "reference_doctype": row.doctype,
+        "reference_name": row.name,
+        "schedule": row.parent if row.parenttype == "Lease Contract Schedule" else None,
+    }).insert(ignore_permissions=True)
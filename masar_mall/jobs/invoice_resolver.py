@@ -0,0 +1,121 @@
+import frappe
+
+
+TAX_ACCOUNTS = [
+    {
+        "account_head": "220000003 - VAT - BM",
+        "description": "VAT",
+        "rate": 0,
+    },
+    {
+        "account_head": "2210000001 - VAT 0 - BM",
+        "description": "VAT 0",
+        "rate": 0,
+    }
+]
+
+
+class InvoiceReferenceResolver:
+    """Run-scoped cache of the Company, Item and tax data shared by the invoice builders."""
+
+    def __init__(self):
+        self.companies = {}
+        self.items = {}
+        self.tax_rows = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch_items(self, lease_names):
+        """Load every rent and service Item used by `lease_names` in a single query."""
+        if not lease_names:
+            return
+
+        items = frappe.db.sql("""
+            SELECT name, item_name, item_group, stock_uom
+            FROM `tabItem`
+            WHERE name IN (
+                SELECT rent_item FROM `tabLease Contract Details`
+                WHERE parenttype = 'Lease Contract' AND parent IN %(leases)s
+                UNION
+                SELECT service_item FROM `tabOther Services Details`
+                WHERE parenttype = 'Lease Contract' AND parent IN %(leases)s
+            )
+        """, {"leases": tuple(lease_names)}, as_dict=True)
+
+        for item in items:
+            self.items[item.name] = item
+
+    def get_company(self, company):
+        if company in self.companies:
+            self.hits += 1
+            return self.companies[company]
+
+        self.misses += 1
+        company_doc = frappe.db.get_value(
+            "Company",
+            company,
+            [
+                "name", "default_receivable_account", "default_income_account", "cost_center",
+                "custom_consolidate_other_services", "custom_consolidate_tenant_billing",
+            ],
+            as_dict=True
+        )
+        if not company_doc:
+            frappe.throw(f"Company {company} not found", frappe.DoesNotExistError)
+
+        self.companies[company] = company_doc
+        return company_doc
+
+    def get_item(self, item_code):
+        if item_code in self.items:
+            self.hits += 1
+            return self.items[item_code]
+
+        self.misses += 1
+        item = frappe.db.get_value(
+            "Item",
+            item_code,
+            ["name", "item_name", "item_group", "stock_uom"],
+            as_dict=True
+        )
+        if not item:
+            frappe.throw(f"Item {item_code} not found", frappe.DoesNotExistError)
+
+        self.items[item_code] = item
+        return item
+
+    def get_tax_rows(self, company):
+        if company in self.tax_rows:
+            self.hits += 1
+            return self.tax_rows[company]
+
+        self.misses += 1
+        cost_center = self.get_company(company).cost_center
+
+        self.tax_rows[company] = [
+            {
+                "charge_type": "On Net Total",
+                "account_head": tax["account_head"],
+                "description": tax["description"],
+                "rate": tax["rate"],
+                "included_in_print_rate": 0,
+                "cost_center": cost_center
+            }
+            for tax in TAX_ACCOUNTS
+        ]
+        return self.tax_rows[company]
+
+    def get_stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "companies": len(self.companies),
+            "items": len(self.items),
+        }
+
+    def log_stats(self, job):
+        stats = self.get_stats()
+        frappe.logger().info(
+            f"{job} | Reference cache hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"companies: {stats['companies']}, items: {stats['items']}"
+        )
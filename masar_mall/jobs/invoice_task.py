@@ -1,62 +1,225 @@
 import frappe
-from frappe.utils import getdate, nowdate
+from frappe.utils import add_to_date, get_datetime, now_datetime
+from masar_mall.jobs.billing_run import BillingRunLog, start_billing_run
+
+# Global default holding the `modified` of the last Sales Invoice the sync has seen
+STATUS_WATERMARK_KEY = "masar_mall_invoice_status_watermark"
+STATUS_SYNC_CHUNK_SIZE = 500
+RECONCILE_CHUNK_SIZE = 2000
+
+# Re-read this far behind the watermark so an invoice committed late with an older
+# `modified` is not missed; re-applying a status is harmless
+STATUS_WATERMARK_OVERLAP_MINUTES = 5
+
 
 def update_lease_schedule_status_from_invoice():
-    """Update Lease Contract Schedule child table with status from Sales Invoice using Python dicts"""
-    
-    today = getdate(nowdate())
-
-    # Step 1: Fetch all Sales Invoices at once
-    invoices = frappe.get_all(
-        "Sales Invoice",
-        filters={"posting_date": ["<=", today]},
-        fields=["name", "status"],
-        ignore_permissions=True
+    """Push the status of lease Sales Invoices changed since the last run into the schedule rows referencing them.
+
+    Sales Invoice and Payment Entry events keep the rows current; this hourly pass only
+    reconciles changes no event covered, such as credit notes and journal entries.
+    """
+    result = frappe._dict(leases=0, invoices=0, schedules=0, skipped=0, errors=0)
+
+    with BillingRunLog(start_billing_run("Invoice Status Sync"), result) as run_log:
+        sync_changed_invoice_statuses(run_log, result)
+        run_log.flush(result)
+
+
+def sync_changed_invoice_statuses(run_log, result):
+    watermark = frappe.db.get_global(STATUS_WATERMARK_KEY)
+    since = add_to_date(get_datetime(watermark), minutes=-STATUS_WATERMARK_OVERLAP_MINUTES) if watermark else None
+
+    changed = 0
+    after = None
+    while True:
+        with run_log.stage("select"):
+            invoices = get_changed_lease_invoices(since, after)
+
+        if not invoices:
+            break
+
+        with run_log.stage("write_back"):
+            result.schedules += apply_invoice_statuses({inv.name: inv.status for inv in invoices})
+
+        changed += len(invoices)
+        after = invoices[-1]
+
+        frappe.db.set_global(STATUS_WATERMARK_KEY, str(after.modified))
+        frappe.db.commit()
+
+    frappe.logger().info(
+        f"Invoice Status Sync | {changed} changed invoices since {watermark or 'the beginning'}, "
+        f"{result.schedules} schedules updated"
     )
 
-    if not invoices:
-        frappe.logger().info("No Sales Invoices found for today or earlier.")
-        return
 
-    # Convert invoices list into a dictionary for quick lookup
-    invoice_dict = {inv['name']: inv['status'] for inv in invoices}
+def get_changed_lease_invoices(since=None, after=None, limit=STATUS_SYNC_CHUNK_SIZE):
+    """Return the next `limit` lease Sales Invoices by (`modified`, `name`) changed at or after `since`."""
+    conditions = []
+    if since:
+        conditions.append("modified >= %(since)s")
+    if after:
+        conditions.append("(modified > %(after_modified)s OR (modified = %(after_modified)s AND name > %(after_name)s))")
+
+    return frappe.db.sql(f"""
+        SELECT name, status, modified
+        FROM `tabSales Invoice`
+        WHERE IFNULL(custom_lease_contract, '') != ''
+            {"".join(f" AND {condition}" for condition in conditions)}
+        ORDER BY modified, name
+        LIMIT %(limit)s
+    """, {
+        "since": since,
+        "after_modified": after.modified if after else None,
+        "after_name": after.name if after else None,
+        "limit": limit,
+    }, as_dict=True)
+
+
+def apply_invoice_statuses(statuses):
+    """Set `invoice_status` on the submitted schedule rows referencing the invoices in
+    `statuses` ({invoice name: status}) and refresh the counters of the schedules that changed.
+
+    Returns the number of schedules updated.
+    """
+    if not statuses:
+        return 0
+
+    rows = frappe.db.sql("""
+        SELECT lci.name, lci.parent, lci.invoice_number, lci.invoice_status
+        FROM `tabLease Contrant invoice` lci
+        INNER JOIN `tabLease Contract Schedule` lcs ON lcs.name = lci.parent
+        WHERE lci.parenttype = 'Lease Contract Schedule'
+            AND lcs.docstatus = 1
+            AND lci.invoice_number IN %(invoices)s
+    """, {"invoices": tuple(statuses)}, as_dict=True)
+
+    changed = [row for row in rows if row.invoice_status != statuses[row.invoice_number]]
+    if not changed:
+        return 0
 
-    # Step 2: Fetch all Lease Contract Schedules with their invoice child tables
-    schedules = frappe.get_all(
-        "Lease Contract Schedule",
-        filters={"docstatus": 1},
-        fields=["name"],
-        ignore_permissions=True
+    status_cases = " ".join(["WHEN %s THEN %s"] * len(changed))
+    values = []
+    for row in changed:
+        values += [row.name, statuses[row.invoice_number]]
+    values += [row.name for row in changed]
+
+    frappe.db.sql(f"""
+        UPDATE `tabLease Contrant invoice`
+        SET invoice_status = CASE name {status_cases} END
+        WHERE parenttype = 'Lease Contract Schedule'
+            AND name IN ({", ".join(["%s"] * len(changed))})
+    """, values)
+
+    schedules = sorted({row.parent for row in changed})
+    refresh_schedule_counters(schedules)
+    return len(schedules)
+
+
+def refresh_schedule_counters(schedule_names=None, first_name=None, last_name=None):
+    """Recompute the invoiced, non-invoiced and paid period counters of the submitted schedules
+    in `schedule_names`, or named `first_name` to `last_name`, in one statement. Only schedules
+    whose counters are wrong are written; returns how many there were."""
+    if schedule_names is not None:
+        if not schedule_names:
+            return 0
+        condition = "{column} IN %(schedules)s"
+    else:
+        condition = "{column} BETWEEN %(first)s AND %(last)s"
+
+    frappe.db.sql(f"""
+        UPDATE `tabLease Contract Schedule` lcs
+        INNER JOIN (
+            SELECT
+                parent,
+                SUM(IFNULL(invoice_number, '') != '') AS invoiced,
+                SUM(IFNULL(invoice_number, '') = '') AS non_invoiced,
+                SUM(IFNULL(invoice_number, '') != '' AND invoice_status = 'Paid') AS paid
+            FROM `tabLease Contrant invoice`
+            WHERE parenttype = 'Lease Contract Schedule'
+                AND {condition.format(column="parent")}
+            GROUP BY parent
+        ) counts ON counts.parent = lcs.name
+        SET
+            lcs.number_of_invoiced_periods = counts.invoiced,
+            lcs.number_of_non_invoiced_periods = counts.non_invoiced,
+            lcs.total_paid_peroid = counts.paid,
+            lcs.modified = %(modified)s
+        WHERE lcs.docstatus = 1
+            AND {condition.format(column="lcs.name")}
+            AND (
+                NOT (lcs.number_of_invoiced_periods <=> counts.invoiced)
+                OR NOT (lcs.number_of_non_invoiced_periods <=> counts.non_invoiced)
+                OR NOT (lcs.total_paid_peroid <=> counts.paid)
+            )
+    """, {
+        "schedules": tuple(schedule_names or ()),
+        "first": first_name,
+        "last": last_name,
+        "modified": now_datetime(),
+    })
+
+    return frappe.db.sql("SELECT ROW_COUNT()")[0][0]
+
+
+@frappe.whitelist()
+def enqueue_schedule_status_reconciliation():
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "masar_mall.jobs.invoice_task.reconcile_schedule_statuses",
+        queue="long",
+        timeout=3600,
+        job_id="lease_schedule_status_reconciliation",
+        deduplicate=True,
     )
+    frappe.msgprint("Lease schedule status reconciliation has been queued.", alert=True, indicator="blue")
+
+
+def reconcile_schedule_statuses(chunk_size=RECONCILE_CHUNK_SIZE):
+    """Full resync of every submitted schedule without loading documents: refresh row
+    `invoice_status` from `tabSales Invoice` and recompute the period counters, a range of
+    `chunk_size` schedule names per statement pair."""
+    result = frappe._dict(leases=0, invoices=0, schedules=0, skipped=0, errors=0)
+
+    with BillingRunLog(start_billing_run("Status Reconciliation"), result) as run_log:
+        last_name = ""
+        while True:
+            with run_log.stage("select"):
+                names = frappe.db.sql_list("""
+                    SELECT name
+                    FROM `tabLease Contract Schedule`
+                    WHERE docstatus = 1 AND name > %s
+                    ORDER BY name
+                    LIMIT %s
+                """, (last_name, chunk_size))
+
+            if not names:
+                break
+
+            with run_log.stage("write_back"):
+                result.schedules += reconcile_schedule_range(names[0], names[-1])
+
+            last_name = names[-1]
+            frappe.db.commit()
+
+        run_log.flush(result)
+
+    frappe.logger().info(f"Lease Schedule Reconciliation | {result.schedules} schedules corrected")
+    return result
+
+
+def reconcile_schedule_range(first_name, last_name):
+    """Reconcile the submitted schedules named `first_name` to `last_name`; returns how many had wrong counters."""
+    frappe.db.sql("""
+        UPDATE `tabLease Contrant invoice` lci
+        INNER JOIN `tabLease Contract Schedule` lcs ON lcs.name = lci.parent
+        INNER JOIN `tabSales Invoice` si ON si.name = lci.invoice_number
+        SET lci.invoice_status = si.status
+        WHERE lci.parenttype = 'Lease Contract Schedule'
+            AND lcs.docstatus = 1
+            AND lcs.name BETWEEN %(first)s AND %(last)s
+            AND NOT (lci.invoice_status <=> si.status)
+    """, {"first": first_name, "last": last_name})
 
-    # Load all schedules into memory
-    for sched in schedules:
-        schedule_doc = frappe.get_doc("Lease Contract Schedule", sched.name)
-        invoiced = 0
-        not_invoiced = 0
-        paid_periods = 0
-        updated = False
-
-        # Update invoice_status in memory
-        for row in schedule_doc.invoice:
-            invoice_number = getattr(row, "invoice_number", None)
-            if invoice_number and invoice_number in invoice_dict:
-                row.invoice_status = invoice_dict[invoice_number]
-                updated = True
-
-            if row.invoice_number:
-                invoiced += 1
-                if row.invoice_status == "Paid":
-                    paid_periods += 1
-            else:
-                not_invoiced += 1
-
-        # Update totals
-        schedule_doc.number_of_invoiced_periods = invoiced
-        schedule_doc.number_of_non_invoiced_periods = not_invoiced
-        schedule_doc.total_paid_peroid = paid_periods
-
-        # Save only if there are changes
-        if updated:
-            schedule_doc.save(ignore_permissions=True)
-            frappe.logger().info(f"Updated status for schedule {sched.name}")
+    return refresh_schedule_counters(first_name=first_name, last_name=last_name)
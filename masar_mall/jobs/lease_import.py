@@ -0,0 +1,366 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import csv
+import io
+import json
+
+import frappe
+from frappe.utils import cint, flt, getdate
+from masar_mall.masar_mall.doctype.floor_unit.floor_unit import rent_floor_units
+from masar_mall.utils.create_log import create_floor_unit_logs, create_logs
+from masar_mall.utils.floor_unit_occupancy import add_unit_occupancy, end_unit_occupancy
+
+
+DEFAULT_IMPORT_BATCH_SIZE = 50
+
+CHILD_TABLES = ("rent_details", "period_details", "other_service")
+
+# Link fields checked up front with one query per doctype
+HEADER_LINKS = {
+    "owner_lessor": "Company",
+    "tenant_lessee": "Customer",
+    "property": "Property",
+    "floor": "Floor",
+    "accommodation_type": "Accommodation Type",
+    "renewed_from": "Lease Contract",
+}
+CHILD_LINKS = {
+    ("rent_details", "floor_unit"): "Floor Unit",
+    ("rent_details", "rent_item"): "Item",
+    ("other_service", "service_item"): "Item",
+}
+
+RESULT_COLUMNS = ["import_key", "rows", "status", "lease_contract", "message"]
+
+
+@frappe.whitelist()
+def enqueue_lease_contract_import(file_url, submit=1, skip_invalid=0):
+    """Queue an import of the contracts in an uploaded CSV or JSON file; the per-contract
+    result file is attached when the job finishes."""
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "masar_mall.jobs.lease_import.run_lease_contract_import",
+        queue="long",
+        timeout=7200,
+        file_url=file_url,
+        submit=cint(submit),
+        skip_invalid=cint(skip_invalid),
+    )
+    frappe.msgprint("Lease contract import has been queued.", alert=True, indicator="blue")
+
+
+def run_lease_contract_import(file_url, submit=1, skip_invalid=0):
+    file_doc = frappe.get_doc("File", {"file_url": file_url})
+    file_format = "json" if file_doc.file_name.lower().endswith(".json") else "csv"
+
+    results = import_lease_contracts(
+        file_doc.get_content(), file_format, submit=cint(submit), skip_invalid=cint(skip_invalid)
+    )
+
+    result_file = frappe.get_doc({
+        "doctype": "File",
+        "file_name": f"lease_import_result_{frappe.utils.now_datetime().strftime('%Y%m%d%H%M%S')}.csv",
+        "content": "".join(iter_import_results_csv(results)),
+        "is_private": 1,
+    })
+    result_file.save(ignore_permissions=True)
+    frappe.db.commit()
+
+    imported = sum(1 for result in results if result["status"] == "Imported")
+    frappe.publish_realtime(
+        "msgprint",
+        f"Lease contract import finished: {imported} of {len(results)} contracts imported. "
+        f"<a href='{result_file.file_url}'>Download the result file</a>",
+        user=frappe.session.user,
+    )
+
+
+def import_lease_contracts(content, file_format="csv", submit=True, batch_size=DEFAULT_IMPORT_BATCH_SIZE, skip_invalid=False):
+    """Validate every contract in `content` first, then create (and submit) them in batches of
+    `batch_size`, one transaction per batch. Returns one result dict per contract.
+
+    Unless `skip_invalid` is set, nothing is written when any contract fails validation.
+    """
+    contracts = parse_lease_contracts(content, file_format)
+    validate_lease_contracts(contracts, submit)
+
+    invalid = [contract for contract in contracts if contract.result["status"] == "Invalid"]
+    if invalid and not skip_invalid:
+        for contract in contracts:
+            if contract.result["status"] != "Invalid":
+                contract.result.update(status="Not Imported", message="Other contracts in the file are invalid")
+        return [contract.result for contract in contracts]
+
+    valid = [contract for contract in contracts if contract.result["status"] != "Invalid"]
+    for start in range(0, len(valid), batch_size):
+        import_contract_batch(valid[start:start + batch_size], submit)
+
+    return [contract.result for contract in contracts]
+
+
+def import_contract_batch(batch, submit):
+    in_lease_bulk_import, mute_messages = frappe.flags.in_lease_bulk_import, frappe.flags.mute_messages
+    frappe.flags.in_lease_bulk_import = True
+    frappe.flags.mute_messages = True
+
+    try:
+        created = []
+        for contract in batch:
+            frappe.db.savepoint("lease_import")
+            try:
+                contract.doc.insert()
+                if submit:
+                    contract.doc.submit()
+                contract.result.update(status="Imported", lease_contract=contract.doc.name)
+                created.append(contract.doc)
+
+            except Exception as e:
+                frappe.db.rollback(save_point="lease_import")
+                contract.result.update(status="Failed", message=str(e))
+
+        if submit:
+            finalize_submitted_contracts(created)
+
+        frappe.db.commit()
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(e, "Lease Contract Import Error")
+        for contract in batch:
+            contract.result.update(status="Failed", lease_contract=None, message=str(e))
+
+    finally:
+        frappe.flags.in_lease_bulk_import = in_lease_bulk_import
+        frappe.flags.mute_messages = mute_messages
+
+
+def finalize_submitted_contracts(docs):
+    """Write what `LeaseContract.on_submit` defers during a bulk import, for a whole batch at once:
+    floor unit tenancy and occupancy, contract and floor unit logs, and renewal status of replaced
+    contracts."""
+    tenants = {
+        row.floor_unit: doc.tenant_lessee
+        for doc in docs
+        for row in doc.rent_details or []
+        if row.floor_unit
+    }
+    rent_floor_units(tenants)
+    create_floor_unit_logs(list(tenants))
+    add_unit_occupancy(docs)
+    create_logs(docs)
+
+    renewed = sorted({doc.renewed_from for doc in docs if doc.renewed_from})
+    if renewed:
+        frappe.db.sql("""
+            UPDATE `tabLease Contract`
+            SET status = 'Renewal', modified = %s
+            WHERE name IN %s
+        """, (frappe.utils.now_datetime(), tuple(renewed)))
+        for doc in docs:
+            if doc.renewed_from:
+                end_unit_occupancy(doc.renewed_from, doc.lease_start)
+        create_logs([frappe.get_doc("Lease Contract", name) for name in renewed])
+
+
+def parse_lease_contracts(content, file_format="csv"):
+    """Turn the file into contracts. JSON is a list of Lease Contract dicts with child lists.
+
+    CSV has one line per child row: lines sharing an `import_key` form one contract, header
+    fields come from its first line and child fields are named `<table>.<field>`, e.g.
+    `rent_details.floor_unit`.
+    """
+    if isinstance(content, bytes):
+        content = content.decode("utf-8-sig")
+
+    if file_format == "json":
+        return [
+            make_import_contract(str(data.pop("import_key", idx)), str(idx), data)
+            for idx, data in enumerate(json.loads(content), start=1)
+        ]
+
+    grouped = {}
+    for line_no, line in enumerate(csv.DictReader(io.StringIO(content)), start=2):
+        key = (line.get("import_key") or "").strip()
+        if not key:
+            frappe.throw(f"Line {line_no}: import_key is required in CSV lease imports")
+
+        contract = grouped.setdefault(key, {"lines": [], "data": {}})
+        contract["lines"].append(str(line_no))
+
+        children = {}
+        for column, value in line.items():
+            value = (value or "").strip()
+            if not value or column == "import_key":
+                continue
+
+            table, _, fieldname = column.partition(".")
+            if fieldname and table in CHILD_TABLES:
+                children.setdefault(table, {})[fieldname] = value
+            elif not fieldname:
+                contract["data"].setdefault(column, value)
+
+        for table, row in children.items():
+            contract["data"].setdefault(table, []).append(row)
+
+    return [
+        make_import_contract(key, ", ".join(contract["lines"]), contract["data"])
+        for key, contract in grouped.items()
+    ]
+
+
+def make_import_contract(import_key, rows, data):
+    return frappe._dict(
+        data=data,
+        doc=None,
+        result={"import_key": import_key, "rows": rows, "status": "Valid", "lease_contract": None, "message": ""},
+    )
+
+
+def validate_lease_contracts(contracts, submit=True):
+    """Build every contract and run its validations without writing anything."""
+    missing_links = find_missing_links(contracts)
+    unavailable_units = find_unavailable_floor_units(contracts)
+
+    mute_messages = frappe.flags.mute_messages
+    frappe.flags.mute_messages = True
+    try:
+        for contract in contracts:
+            key = contract.result["import_key"]
+            errors = missing_links.get(key, []) + unavailable_units.get(key, [])
+
+            try:
+                contract.doc = build_lease_contract(contract.data, submit)
+                contract.doc._validate_mandatory()
+                contract.doc.run_method("validate")
+            except Exception as e:
+                errors.append(str(e) or e.__class__.__name__)
+
+            if errors:
+                contract.result.update(status="Invalid", message="; ".join(errors))
+    finally:
+        frappe.flags.mute_messages = mute_messages
+
+
+def build_lease_contract(data, submit=True):
+    """A new Lease Contract with the totals and derived values the form normally fills in."""
+    doc = frappe.get_doc(dict(data, doctype="Lease Contract", status="Draft"))
+
+    for row in doc.rent_details:
+        if not flt(row.amount):
+            row.amount = flt(row.rate)
+
+    for period in doc.period_details:
+        if period.from_date and period.to_date and not cint(period.month_in_period):
+            from_date, to_date = getdate(period.from_date), getdate(period.to_date)
+            period.month_in_period = (to_date.year - from_date.year) * 12 + to_date.month - from_date.month + 1
+        if not flt(period.amount):
+            period.amount = flt(period.space_amount) + flt(period.service_amount)
+
+    for service in doc.other_service:
+        service.amount = flt(service.rate)
+
+    doc.total_rent_elements = len(doc.rent_details)
+    doc.total_rent_amount = sum(flt(row.amount) for row in doc.rent_details)
+    doc.total_quantity = len(doc.other_service)
+    doc.total_service = sum(flt(service.amount) for service in doc.other_service)
+
+    # on_submit skips the status round trip during bulk imports; drafts stay Draft
+    if submit:
+        doc.status = "Rent"
+    return doc
+
+
+def find_missing_links(contracts):
+    """Check every linked record of every contract with one query per linked doctype."""
+    wanted = {}
+    for contract in contracts:
+        data = contract.data
+        for fieldname, doctype in HEADER_LINKS.items():
+            if data.get(fieldname):
+                wanted.setdefault(doctype, set()).add(data[fieldname])
+        for (table, fieldname), doctype in CHILD_LINKS.items():
+            for row in data.get(table) or []:
+                if row.get(fieldname):
+                    wanted.setdefault(doctype, set()).add(row[fieldname])
+
+    existing = {
+        doctype: set(frappe.get_all(doctype, filters={"name": ("in", list(names))}, pluck="name"))
+        for doctype, names in wanted.items()
+    }
+
+    missing = {}
+    for contract in contracts:
+        data = contract.data
+        links = [(fieldname, doctype, data.get(fieldname)) for fieldname, doctype in HEADER_LINKS.items()]
+        links += [
+            (fieldname, doctype, row.get(fieldname))
+            for (table, fieldname), doctype in CHILD_LINKS.items()
+            for row in data.get(table) or []
+        ]
+        for fieldname, doctype, value in links:
+            if value and value not in existing[doctype]:
+                missing.setdefault(contract.result["import_key"], []).append(f"{doctype} {value} not found ({fieldname})")
+
+    return missing
+
+
+def find_unavailable_floor_units(contracts):
+    """Floor units that are disabled or not submitted, or claimed by two contracts in the file
+    for overlapping dates. Units already leased are left to the occupancy check in
+    `LeaseContract.validate`, which knows the lease dates and lets a renewal take its units over."""
+    claims = {}
+    for contract in contracts:
+        data = contract.data
+        for row in data.get("rent_details") or []:
+            if row.get("floor_unit"):
+                claims.setdefault(row["floor_unit"], []).append(
+                    (contract.result["import_key"], data.get("lease_start"), data.get("lease_end"))
+                )
+
+    if not claims:
+        return {}
+
+    units = {
+        unit.name: unit
+        for unit in frappe.get_all(
+            "Floor Unit",
+            filters={"name": ("in", list(claims))},
+            fields=["name", "disabled", "docstatus"]
+        )
+    }
+
+    problems = {}
+    for floor_unit, unit_claims in claims.items():
+        unit = units.get(floor_unit)
+        if unit and (unit.disabled or unit.docstatus != 1):
+            for key, _, _ in unit_claims:
+                problems.setdefault(key, []).append(f"Floor Unit {floor_unit} is not available")
+            continue
+
+        for idx, (key, start, end) in enumerate(unit_claims):
+            others = [
+                other_key for other_idx, (other_key, other_start, other_end) in enumerate(unit_claims)
+                if other_idx != idx and claims_overlap(start, end, other_start, other_end)
+            ]
+            if others:
+                problems.setdefault(key, []).append(f"Floor Unit {floor_unit} is also used by contracts {', '.join(others)}")
+
+    return problems
+
+
+def claims_overlap(start, end, other_start, other_end):
+    # Without dates the claims cannot be told apart, so they count as overlapping
+    if not (start and end and other_start and other_end):
+        return True
+    return getdate(start) <= getdate(other_end) and getdate(other_start) <= getdate(end)
+
+
+def iter_import_results_csv(results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_COLUMNS)
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result)
+    yield buffer.getvalue()
@@ -0,0 +1,174 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import add_days, add_months, cint, flt, getdate, nowdate, rounded
+from masar_mall.jobs.lease_import import finalize_submitted_contracts
+
+
+DEFAULT_RENEWAL_CHUNK_SIZE = 25
+
+
+@frappe.whitelist()
+def enqueue_mass_renewal(lease_end_from, lease_end_to, property=None, status="Rent", escalation_percent=0, submit=0):
+    """Queue the renewal of every contract ending between two dates; progress and a summary
+    are pushed to the requesting user."""
+    frappe.only_for("System Manager")
+
+    frappe.enqueue(
+        "masar_mall.jobs.lease_renewal.renew_expiring_contracts",
+        queue="long",
+        timeout=7200,
+        job_id=f"lease_mass_renewal|{lease_end_from}|{lease_end_to}|{property or ''}",
+        deduplicate=True,
+        lease_end_from=lease_end_from,
+        lease_end_to=lease_end_to,
+        property=property,
+        status=status,
+        escalation_percent=escalation_percent,
+        submit=cint(submit),
+    )
+    frappe.msgprint("Lease contract renewal has been queued.", alert=True, indicator="blue")
+
+
+def renew_expiring_contracts(
+    lease_end_from,
+    lease_end_to,
+    property=None,
+    status="Rent",
+    escalation_percent=0,
+    submit=0,
+    chunk_size=DEFAULT_RENEWAL_CHUNK_SIZE,
+):
+    """Create a renewal for each selected contract, `chunk_size` contracts per transaction.
+
+    Renewals start the day after the old contract ends, run for the same number of months and
+    carry the rent over, raised by `escalation_percent`. Contracts that already have a live
+    renewal are skipped.
+    """
+    lease_names = get_renewable_contracts(lease_end_from, lease_end_to, property, status)
+    summary = frappe._dict(selected=len(lease_names), renewed=0, skipped=0, errors=0, renewals=[])
+
+    for start in range(0, len(lease_names), chunk_size):
+        renew_contract_chunk(lease_names[start:start + chunk_size], flt(escalation_percent), cint(submit), summary)
+
+        frappe.publish_progress(
+            min(start + chunk_size, len(lease_names)) * 100 / len(lease_names),
+            title="Renewing Lease Contracts",
+            description=f"{min(start + chunk_size, len(lease_names))} of {len(lease_names)} contracts",
+        )
+
+    message = (
+        f"Lease contract renewal finished: {summary.renewed} of {summary.selected} contracts renewed, "
+        f"{summary.skipped} already renewed, {summary.errors} errors"
+    )
+    frappe.logger().info(message)
+    frappe.publish_realtime("msgprint", message, user=frappe.session.user)
+    return summary
+
+
+def get_renewable_contracts(lease_end_from, lease_end_to, property=None, status="Rent"):
+    filters = {
+        "docstatus": 1,
+        "status": ("in", status if isinstance(status, (list, tuple)) else [status]),
+        "lease_end": ("between", [getdate(lease_end_from), getdate(lease_end_to)]),
+    }
+    if property:
+        filters["property"] = property
+
+    return frappe.get_all("Lease Contract", filters=filters, order_by="lease_end, name", pluck="name")
+
+
+def renew_contract_chunk(lease_names, escalation_percent, submit, summary):
+    already_renewed = set(frappe.get_all(
+        "Lease Contract",
+        filters={"renewed_from": ("in", lease_names), "docstatus": ("<", 2)},
+        pluck="renewed_from"
+    ))
+
+    in_lease_bulk_import, mute_messages = frappe.flags.in_lease_bulk_import, frappe.flags.mute_messages
+    frappe.flags.in_lease_bulk_import = True
+    frappe.flags.mute_messages = True
+    renewals = []
+
+    try:
+        for lease_name in lease_names:
+            if lease_name in already_renewed:
+                summary.skipped += 1
+                continue
+
+            frappe.db.savepoint("lease_renewal")
+            try:
+                renewal = make_renewal(frappe.get_doc("Lease Contract", lease_name), escalation_percent, submit)
+                renewal.insert()
+                if submit:
+                    renewal.submit()
+                renewals.append(renewal)
+
+            except Exception as e:
+                frappe.db.rollback(save_point="lease_renewal")
+                frappe.log_error(e, f"Lease Renewal Error | Lease: {lease_name}")
+                summary.errors += 1
+
+        if submit:
+            finalize_submitted_contracts(renewals)
+
+        frappe.db.commit()
+        summary.renewed += len(renewals)
+        summary.renewals += [renewal.name for renewal in renewals]
+
+    except Exception as e:
+        # Contracts that failed or were skipped above are already counted; the rollback
+        # loses the renewals made so far
+        frappe.db.rollback()
+        for renewal in renewals:
+            frappe.log_error(e, f"Lease Renewal Error | Lease: {renewal.renewed_from}")
+        summary.errors += len(renewals)
+
+    finally:
+        frappe.flags.in_lease_bulk_import = in_lease_bulk_import
+        frappe.flags.mute_messages = mute_messages
+
+
+def make_renewal(lease_doc, escalation_percent=0, submit=False):
+    """A draft copy of `lease_doc` for the same number of months right after it ends."""
+    months = cint(lease_doc.period_in_months)
+    factor = 1 + flt(escalation_percent) / 100
+
+    renewal = frappe.copy_doc(lease_doc)
+    renewal.renewed_from = lease_doc.name
+    # on_submit skips the status round trip during bulk runs; drafts stay Draft
+    renewal.status = "Rent" if submit else "Draft"
+    renewal.contract_date = nowdate()
+    renewal.lease_start = add_days(lease_doc.lease_end, 1)
+    renewal.lease_end = add_days(add_months(renewal.lease_start, months), -1)
+
+    # A free allowance belongs to the original term
+    renewal.allowance_period = 0
+    renewal.in_period = 0
+    renewal.out_period = 0
+
+    for row in renewal.rent_details:
+        row.rate = rounded(flt(row.rate) * factor, 6)
+        row.amount = rounded(flt(row.amount) * factor, 6)
+
+    # Periods keep their lengths but are laid end to end from the new lease start, since the old
+    # term need not have been whole months
+    period_start = renewal.lease_start
+    for period in renewal.period_details:
+        period.from_date = period_start
+        period.to_date = min(
+            getdate(add_days(add_months(period_start, cint(period.month_in_period)), -1)), getdate(renewal.lease_end)
+        )
+        period.space_amount = rounded(flt(period.space_amount) * factor, 6)
+        period.service_amount = rounded(flt(period.service_amount) * factor, 6)
+        period.amount = flt(period.space_amount) + flt(period.service_amount)
+        period_start = add_days(period.to_date, 1)
+
+    for service in renewal.other_service:
+        service.invoice_number = None
+        if service.invoice_date:
+            service.invoice_date = add_months(service.invoice_date, months)
+
+    renewal.total_rent_amount = sum(flt(row.amount) for row in renewal.rent_details)
+    return renewal
@@ -4,6 +4,7 @@
 import frappe
 from frappe.model.document import Document
 from datetime import time
+from masar_mall.utils.rental_space_config import get_rental_space_config
 
 
 class Floor(Document):
@@ -17,12 +18,10 @@ class Floor(Document):
             "name"
         )
 
+        config = get_rental_space_config(self.company)
+
         if not warehouse_name:
-            stock_account = frappe.db.get_value(
-                "Account",
-                {"account_type": "Stock", "company": self.company},
-                "name"
-            )
+            stock_account = config.stock_account
             if not stock_account:
                 frappe.throw(f"No Stock Account found for company '{self.company}'.")
 
@@ -43,18 +42,11 @@ class Floor(Document):
         self.db_set("wh_name", warehouse_name)
 
    
-        item_code = frappe.get_value("Item", {"is_stock_item": 1, "custom_rent_space": 1}, "name")
+        item_code = config.item_code
         if not item_code:
             frappe.throw("No stock item with Rent Space enabled was found. Please create or update an Item.")
    
-        expense_account = frappe.db.get_value("Account", {"account_type": "Temporary", "company": self.company},"name")
-        if not expense_account:
-       
-            expense_account = frappe.db.get_value(
-                "Account",
-                {"account_type": "Stock Adjustment", "company": self.company},
-                "name"
-            )
+        expense_account = config.expense_account
         if not expense_account:
             frappe.throw(f"No valid Expense Account found for company '{self.company}'.")
 
@@ -4,19 +4,24 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
-from masar_mall.utils.create_log import create_floor_unit_log
+from frappe.utils import flt
+from masar_mall.utils.create_log import create_floor_unit_log, create_floor_unit_logs
+from masar_mall.utils.floor_occupancy import refresh_floor_occupancy, refresh_floor_unit_occupancy
+from masar_mall.utils.rental_space_config import get_rental_space_config
 
 
 class FloorUnit(Document):
     def on_submit(self):
         self.create_stock_entry()
         create_floor_unit_log(self)
+        refresh_floor_occupancy([(self.property, self.floor)])
     def on_update(self):
         self.update_tenant_se()
 
     def create_stock_entry(self):
-        wh_ta = frappe.db.get_value("Warehouse", {"warehouse_type": "Rental Space"}, "name")
-        item_code = frappe.get_value("Item", {"is_stock_item": 1, "custom_rent_space": 1}, "name")
+        config = get_rental_space_config(self.company)
+        wh_ta = config.warehouse
+        item_code = config.item_code
 
         if not item_code:
             frappe.throw("No stock item with Rent Space enabled was found. Please create or update an Item.")
@@ -71,6 +76,7 @@ class FloorUnit(Document):
         self.reverse_stock_entries()
         
         frappe.db.set_value(self.doctype, self.name, "disabled", 1)
+        refresh_floor_occupancy([(self.property, self.floor)])
         frappe.db.commit()
         
         self.reload()
@@ -81,54 +87,193 @@ class FloorUnit(Document):
         return True
     
     def reverse_stock_entries(self):
-        se_sql = frappe.db.sql("""
-            SELECT parent
-            FROM `tabStock Entry Detail`
-            WHERE floor_unit = %s AND docstatus = 1
-        """, (self.name,), as_dict=True)
-        
-        if se_sql:
-            for row in se_sql:
-                stock_entry = frappe.get_doc("Stock Entry", row.parent)
-                reversal = frappe.new_doc("Stock Entry")
-                reversal.stock_entry_type = "Material Transfer"
-                reversal.purpose = stock_entry.purpose
-                reversal.from_warehouse = stock_entry.to_warehouse
-                reversal.to_warehouse = stock_entry.from_warehouse
-                reversal.custom_ref_doc = self.name
-                
-                for item in stock_entry.items:
-                    reversal.append("items", {
-                        "item_code": item.item_code,
-                        "qty": item.qty,
-                        "uom": item.uom,
-                        "stock_uom": item.stock_uom,
-                        "conversion_factor": item.conversion_factor,
-                        "floor_unit": item.floor_unit,
-                        "s_warehouse": item.t_warehouse,
-                        "t_warehouse": item.s_warehouse
-                    })
-
-                reversal.insert(ignore_permissions=True)
-                reversal.submit()
-
-                frappe.msgprint(
-                    f"Reversal Stock Entry <b>{reversal.name}</b> created for {row.parent}", 
-                    alert=True, 
-                    indicator="green"
-                )
-    
+        reverse_floor_unit_stock([self.name], ref_doc=self.name)
+
     @frappe.whitelist()
     def release_from_lease(self):
-        self.reverse_stock_entries()
-        
-        frappe.db.set_value(self.doctype, self.name, "rent_space", 0)
-        frappe.db.set_value(self.doctype, self.name, "free_space", 1)
-        frappe.db.set_value(self.doctype, self.name, "tenant", None)
+        release_floor_units([self.name], ref_doc=self.name)
         frappe.db.commit()
-        
+
         self.reload()
-        
-        create_floor_unit_log(self)
-        
-        return True
\ No newline at end of file
+
+        return True
+
+def get_floor_unit_stock_balances(floor_units):
+    """Net stock quantity each of `floor_units` has transferred between two warehouses, from one
+    aggregate query over their submitted Stock Entry rows.
+
+    Returns one dict per unit, item and warehouse pair still holding a balance, with `s_warehouse`
+    and `t_warehouse` set in the direction the balance was moved.
+    """
+    if not floor_units:
+        return []
+
+    rows = frappe.db.sql("""
+        SELECT
+            sed.floor_unit, sed.item_code, sed.stock_uom, se.company,
+            sed.s_warehouse, sed.t_warehouse, SUM(sed.transfer_qty) AS qty
+        FROM `tabStock Entry Detail` sed
+        INNER JOIN `tabStock Entry` se ON se.name = sed.parent
+        WHERE sed.docstatus = 1
+            AND sed.floor_unit IN %(floor_units)s
+            AND IFNULL(sed.s_warehouse, '') != ''
+            AND IFNULL(sed.t_warehouse, '') != ''
+        GROUP BY sed.floor_unit, sed.item_code, sed.stock_uom, se.company, sed.s_warehouse, sed.t_warehouse
+    """, {"floor_units": tuple(floor_units)}, as_dict=True)
+
+    # Transfers A -> B and B -> A of the same unit and item cancel out
+    net = {}
+    for row in rows:
+        first, second = sorted([row.s_warehouse, row.t_warehouse])
+        key = (row.company, row.floor_unit, row.item_code, row.stock_uom, first, second)
+        net[key] = net.get(key, 0) + (flt(row.qty) if row.s_warehouse == first else -flt(row.qty))
+
+    balances = []
+    for (company, floor_unit, item_code, stock_uom, first, second), qty in net.items():
+        qty = flt(qty, 6)
+        if not qty:
+            continue
+        balances.append(frappe._dict(
+            company=company,
+            floor_unit=floor_unit,
+            item_code=item_code,
+            stock_uom=stock_uom,
+            qty=abs(qty),
+            s_warehouse=first if qty > 0 else second,
+            t_warehouse=second if qty > 0 else first,
+        ))
+
+    return balances
+
+
+def reverse_floor_unit_stock(floor_units, ref_doc=None, remarks=None):
+    """Move the net stock balance of `floor_units` back with one Material Transfer per company,
+    one row per unit and warehouse pair. Returns the names of the reversal entries."""
+    by_company = {}
+    for balance in get_floor_unit_stock_balances(floor_units):
+        by_company.setdefault(balance.company, []).append(balance)
+
+    reversals = []
+    for company, balances in by_company.items():
+        reversal = frappe.new_doc("Stock Entry")
+        reversal.stock_entry_type = "Material Transfer"
+        reversal.company = company
+        reversal.custom_ref_doc = ref_doc
+        reversal.remarks = remarks
+
+        for balance in sorted(balances, key=lambda balance: balance.floor_unit):
+            reversal.append("items", {
+                "item_code": balance.item_code,
+                "qty": balance.qty,
+                "uom": balance.stock_uom,
+                "stock_uom": balance.stock_uom,
+                "conversion_factor": 1,
+                "floor_unit": balance.floor_unit,
+                "s_warehouse": balance.t_warehouse,
+                "t_warehouse": balance.s_warehouse
+            })
+
+        reversal.insert(ignore_permissions=True)
+        reversal.submit()
+        reversals.append(reversal.name)
+
+    if reversals:
+        frappe.msgprint(
+            f"Reversal Stock Entry <b>{', '.join(reversals)}</b> created for {len(floor_units)} floor unit(s)",
+            alert=True,
+            indicator="green"
+        )
+
+    return reversals
+
+
+def release_floor_units(floor_units, ref_doc=None, remarks=None):
+    """Reverse the stock of `floor_units` in one entry and mark them free, with one UPDATE for the
+    units and one INSERT for their logs. Runs inside the caller's transaction."""
+    floor_units = list(dict.fromkeys(floor_units))
+    if not floor_units:
+        return
+
+    reverse_floor_unit_stock(floor_units, ref_doc=ref_doc, remarks=remarks)
+
+    frappe.db.sql("""
+        UPDATE `tabFloor Unit`
+        SET rent_space = 0, free_space = 1, tenant = NULL, modified = %(now)s, modified_by = %(user)s
+        WHERE name IN %(floor_units)s
+    """, {"floor_units": tuple(floor_units), "now": frappe.utils.now_datetime(), "user": frappe.session.user})
+
+    refresh_floor_unit_occupancy(floor_units)
+    create_floor_unit_logs(floor_units)
+
+
+def rent_floor_units(tenants):
+    """Mark the floor units in `tenants` ({floor unit: tenant}) as rented to their tenant in one UPDATE
+    and recount the occupancy of their floors."""
+    if not tenants:
+        return
+
+    tenant_cases = " ".join(["WHEN %s THEN %s"] * len(tenants))
+    values = []
+    for floor_unit, tenant in tenants.items():
+        values += [floor_unit, tenant]
+    values += [frappe.utils.now_datetime(), frappe.session.user] + list(tenants)
+
+    frappe.db.sql(f"""
+        UPDATE `tabFloor Unit`
+        SET
+            rent_space = 1,
+            tenant = CASE name {tenant_cases} END,
+            modified = %s,
+            modified_by = %s
+        WHERE name IN ({", ".join(["%s"] * len(tenants))})
+    """, values)
+    refresh_floor_unit_occupancy(list(tenants))
+
+
+def on_doctype_update():
+    # Free-unit search: equality columns first, the area range last
+    frappe.db.add_index("Floor Unit", ["property", "rent_space", "disabled", "docstatus", "space"], "free_unit_search_index")
+    frappe.db.add_index(
+        "Floor Unit", ["property", "floor", "rent_space", "disabled", "docstatus", "space"], "free_unit_floor_search_index"
+    )
+
+
+@frappe.whitelist()
+@frappe.validate_and_sanitize_search_inputs
+def get_free_floor_units(doctype, txt, searchfield, start, page_len, filters):
+    """Link search for free floor units: submitted, not rented and not disabled units of a property,
+    optionally on one floor, within an area range and leaving out units in `exclude`."""
+    filters = frappe._dict(filters or {})
+    if not filters.property:
+        return []
+
+    conditions = ["property = %(property)s", "rent_space = 0", "disabled = 0", "docstatus = 1"]
+    values = {
+        "property": filters.property,
+        "txt": f"%{txt}%",
+        "start": start,
+        "page_len": page_len,
+    }
+
+    if filters.floor:
+        conditions.append("floor = %(floor)s")
+        values["floor"] = filters.floor
+    if filters.min_area:
+        conditions.append("space >= %(min_area)s")
+        values["min_area"] = flt(filters.min_area)
+    if filters.max_area:
+        conditions.append("space <= %(max_area)s")
+        values["max_area"] = flt(filters.max_area)
+    if filters.exclude:
+        conditions.append("name NOT IN %(exclude)s")
+        values["exclude"] = tuple(filters.exclude)
+    if txt:
+        conditions.append("(name LIKE %(txt)s OR floor_unit_name LIKE %(txt)s)")
+
+    return frappe.db.sql(f"""
+        SELECT name, floor_unit_name, floor, space
+        FROM `tabFloor Unit`
+        WHERE {" AND ".join(conditions)}
+        ORDER BY space, name
+        LIMIT %(start)s, %(page_len)s
+    """, values)
@@ -0,0 +1,8 @@
+// Copyright (c) 2025, KCSC and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Floor Unit Occupancy", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,13 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class FloorUnitOccupancy(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Floor Unit Occupancy", ["floor_unit", "lease_start", "lease_end"], "floor_unit_interval_index")
@@ -0,0 +1,17 @@
+// Copyright (c) 2025, KCSC and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Lease Billing Run"] = {
+	get_indicator(doc) {
+		if (doc.status === "Running") {
+			return [__("Running"), "orange", "status,=,Running"];
+		}
+		if (doc.status === "Failed") {
+			return [__("Failed"), "red", "status,=,Failed"];
+		}
+		if (doc.error_count) {
+			return [__("Completed with Errors"), "yellow", "status,=,Completed"];
+		}
+		return [__("Completed"), "green", "status,=,Completed"];
+	},
+};
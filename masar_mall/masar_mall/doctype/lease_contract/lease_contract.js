@@ -193,14 +193,16 @@ function filter_rent_details(frm) {
         floor_unit_field.original_get_query = floor_unit_field.get_query;
     }
 
-    floor_unit_field.get_query = function () {
+    floor_unit_field.get_query = function (doc, cdt, cdn) {
         if (frm.doc.docstatus === 0 && frm.doc.property) {
             return {
+                query: "masar_mall.masar_mall.doctype.floor_unit.floor_unit.get_free_floor_units",
                 filters: {
                     property: frm.doc.property,
-                    docstatus: 1,
-                    disabled: 0,
-                    floor: frm.doc.floor || null
+                    floor: frm.doc.floor || null,
+                    exclude: (frm.doc.rent_details || [])
+                        .filter(row => row.floor_unit && row.name !== cdn)
+                        .map(row => row.floor_unit)
                 }
             };
         }
@@ -312,12 +314,22 @@ function generate_rent_schedule_html(frm) {
             return;
         }
 
+        // The server answers "not modified" when the billing terms still hash to the preview we hold
+        const cached = frm.schedule_preview && frm.schedule_preview.name === frm.doc.name ? frm.schedule_preview : null;
+
         frappe.call({
             method: "generate_schedule_preview",
             doc: frm.doc,
+            args: {
+                known_hash: cached ? cached.hash : null
+            },
             callback: function (response) {
-                if (response.message) {
-                    render_schedule_table(frm, response.message, true);
+                const preview = response.message;
+                if (preview && preview.not_modified && cached) {
+                    render_schedule_table(frm, cached.data, true);
+                } else if (preview && !preview.not_modified) {
+                    frm.schedule_preview = { name: frm.doc.name, hash: preview.hash, data: preview };
+                    render_schedule_table(frm, preview, true);
                 } else {
                     frm.fields_dict['rent_schedule'].html(
                         "<p style='color:red;'>Error generating preview. Please check your data.</p>"
@@ -1,11 +1,25 @@
 # Copyright (c) 2025, KCSC and contributors
 # For license information, please see license.txt
 
+import hashlib
+import json
+
 import frappe
 from dateutil.relativedelta import relativedelta
-from frappe.utils import add_months, get_last_day, getdate, flt, cint, get_first_day, rounded
+from frappe.utils import getdate, flt, cint, rounded
 from frappe.model.document import Document
-from masar_mall.utils.create_log import create_log, create_floor_unit_log
+from masar_mall.masar_mall.doctype.floor_unit.floor_unit import release_floor_units, rent_floor_units
+from masar_mall.utils.create_log import create_log, create_floor_unit_logs
+from masar_mall.utils.floor_unit_occupancy import (
+    add_unit_occupancy,
+    end_unit_occupancy,
+    get_overlapping_occupancy,
+    remove_unit_occupancy,
+)
+from masar_mall.utils.lease_schedule import ContractPeriod, LeaseTerms, build_lease_schedule
+
+# Seconds a schedule preview stays cached; entries are keyed by content, so they never go stale
+SCHEDULE_PREVIEW_CACHE_TTL = 6 * 60 * 60
 
 
 class LeaseContract(Document):
@@ -17,14 +31,25 @@ class LeaseContract(Document):
         self.validate_renewal_link()
         self.validate_period_details()
         self.validate_rent_totals()
+        self.validate_floor_unit_occupancy()
     def on_submit(self):
+        if frappe.flags.in_lease_bulk_import:
+            # The importer sets the status up front and writes floor units, logs and
+            # renewals for the whole batch
+            self.create_lease_schedule()
+            return
+
         frappe.set_value(self.doctype, self.name, "status", "Rent")
         self.create_lease_schedule()
         self.update_floor_unit()
+        add_unit_occupancy([self])
         if self.renewed_from:
             self.renew_lease(self.renewed_from)
         create_log(self)
 
+    def on_cancel(self):
+        remove_unit_occupancy(self.name)
+
 
     def validate_dates(self):
         if self.lease_start and self.lease_end:
@@ -76,6 +101,23 @@ class LeaseContract(Document):
                     indicator="orange"
                 )
                 
+    def validate_floor_unit_occupancy(self):
+        floor_units = [row.floor_unit for row in self.rent_details or [] if row.floor_unit]
+        duplicates = {floor_unit for floor_unit in floor_units if floor_units.count(floor_unit) > 1}
+        if duplicates:
+            frappe.throw(f"Floor Unit <b>{', '.join(sorted(duplicates))}</b> is added more than once in rent details.")
+
+        if not self.lease_start or not self.lease_end:
+            return
+
+        # A renewal takes its units over from the contract it renews
+        overlap = get_overlapping_occupancy(floor_units, self.lease_start, self.lease_end, [self.name, self.renewed_from])
+        if overlap:
+            frappe.throw(
+                f"Floor Unit <b>{overlap.floor_unit}</b> is leased under contract <b>{overlap.lease_contract}</b> "
+                f"from {overlap.lease_start} to {overlap.lease_end}, which overlaps this contract."
+            )
+
     def validate_period_details(self):
         if self.contract_multi_period:
             if self.period_details:
@@ -106,155 +148,77 @@ class LeaseContract(Document):
         if not self.billing_frequency:
             frappe.throw("Billing frequency must be set to create lease schedule")
 
+        if self.contract_multi_period and not self.period_details:
+            frappe.throw("Period details are required for multi-period contracts to create lease schedule")
+
+        if not self.contract_multi_period and not self.rent_details:
+            frappe.throw("Rent details are required to create lease schedule")
+
+        lease_schedule = build_lease_schedule(self.get_schedule_terms())
+
         schedule = frappe.new_doc("Lease Contract Schedule")
         schedule.lease_contract = self.name
         schedule.posting_date = frappe.utils.nowdate()
-        total_schedule_months = 0
+        schedule.total_peroid = lease_schedule.total_period
+
+        for row in lease_schedule.rows:
+            schedule.append("invoice", {
+                "lease_start": row.lease_start,
+                "lease_end": row.lease_end,
+                "amount": row.amount,
+                "is_allowance": row.is_allowance
+            })
 
-        billing_interval = cint(self.billing_frequency)
-        allowance_months = self.allowance_period if self.allowance_period else 0
+        schedule.insert_submitted()
 
         if self.contract_multi_period:
-            if not self.period_details:
-                frappe.throw("Period details are required for multi-period contracts to create lease schedule")
-
-            total_schedule_months = 0
-            free_months_applied = False
-
-            if self.out_period and allowance_months > 0:
-                first_period_start = getdate(self.period_details[0].from_date)
-                self.add_free_months(schedule, first_period_start, allowance_months)
-                shift_months = allowance_months
-            else:
-                shift_months = 0
-
-            for idx, period in enumerate(self.period_details):
-                period_start = getdate(period.from_date)
-                period_end = getdate(period.to_date)
-                months_in_period = cint(period.month_in_period)
-                monthly_rent = rounded(flt(period.amount / months_in_period, 6), 6)
-
-                current_start = add_months(period_start, shift_months) if idx == 0 else period_start
-
-                if self.in_period and allowance_months > 0 and not free_months_applied:
-                    self.add_free_months(schedule, current_start, allowance_months)
-                    current_start = add_months(current_start, allowance_months)
-                    free_months_applied = True
-                    monthly_rent = rounded(flt(period.amount / (months_in_period - allowance_months), 6), 6)
-                paid_period_end = period_end
-                if self.in_period and allowance_months > 0 and idx == 0:
-                    paid_period_end = add_months(current_start, months_in_period - allowance_months) - relativedelta(days=1)
-
-                self.add_paid_invoices(schedule, current_start, paid_period_end, months_in_period if idx > 0 else months_in_period - (allowance_months if self.in_period else 0), billing_interval, monthly_rent)
-                total_schedule_months += months_in_period
-
-            if self.out_period and allowance_months > 0:
-                total_schedule_months += allowance_months
-
-            schedule.total_peroid = total_schedule_months
-            schedule.insert(ignore_permissions=True)
-            schedule.submit()
             frappe.msgprint("Lease Contract Schedule (multi-period) has been created successfully.", alert=True, indicator="green")
-            return
-
-        if not self.rent_details:
-            frappe.throw("Rent details are required to create lease schedule")
-
-        start_date = getdate(self.lease_start)
-        end_date = getdate(self.lease_end)
-        total_months = self.period_in_months
-
-        rent_total = sum(rounded(flt(d.amount, 6), 6) for d in self.rent_details if d.rent_space)
-        service_total = sum(rounded(flt(d.amount, 6), 6) for d in self.rent_details if not d.rent_space)
-        total_rent = rent_total + service_total
-        monthly_rent = rounded(flt(total_rent / total_months, 6), 6)
-        total_months_with_allowance = total_months
-        if self.out_period and allowance_months > 0:
-            total_months_with_allowance += allowance_months
-        if self.in_period and allowance_months > 0:
-            monthly_rent = rounded(flt(total_rent / (total_months - allowance_months), 6), 6)
-
-        schedule.total_peroid = total_months_with_allowance
-        current_start = start_date
-
-        if self.in_period and allowance_months > 0:
-            self.add_free_months(schedule, current_start, allowance_months)
-            current_start = add_months(current_start, allowance_months)
-            self.add_paid_invoices(schedule, current_start, end_date, total_months - allowance_months, billing_interval, monthly_rent)
-        elif self.out_period and allowance_months > 0:
-            self.add_free_months(schedule, current_start, allowance_months)
-            current_start = add_months(current_start, allowance_months)
-            total_months_with_allowance = total_months + allowance_months
-            extended_end_date = add_months(end_date, allowance_months)
-            self.add_paid_invoices(schedule, current_start, extended_end_date, total_months, billing_interval, monthly_rent)
         else:
-            self.add_paid_invoices(schedule, current_start, end_date, total_months, billing_interval, monthly_rent)
-
-        schedule.insert(ignore_permissions=True)
-        schedule.submit()
-        frappe.msgprint("Lease Contract Schedule has been created successfully.", alert=True, indicator="green")
+            frappe.msgprint("Lease Contract Schedule has been created successfully.", alert=True, indicator="green")
 
-    def add_free_months(self, schedule, start_date, num_months):
-        current_date = start_date
-        
-        for i in range(num_months):
-            period_start = current_date
-            period_end = get_last_day(period_start)
-            
-            schedule.append("invoice", {
-                "lease_start": period_start,
-                "lease_end": period_end,
-                "amount": 0,
-                "is_allowance": 1
-            })
-            
-            current_date = add_months(current_date, 1)
+    def get_schedule_terms(self):
+        """The billing terms of this contract as plain values for the schedule engine."""
+        periods = ()
+        if self.contract_multi_period:
+            periods = tuple(
+                ContractPeriod(getdate(p.from_date), getdate(p.to_date), cint(p.month_in_period), flt(p.amount))
+                for p in self.period_details
+            )
+
+        rent_total = (
+            sum(rounded(flt(d.amount, 6), 6) for d in self.rent_details or [] if d.rent_space)
+            + sum(rounded(flt(d.amount, 6), 6) for d in self.rent_details or [] if not d.rent_space)
+        )
+
+        return LeaseTerms(
+            lease_start=getdate(self.lease_start),
+            lease_end=getdate(self.lease_end),
+            period_in_months=cint(self.period_in_months),
+            billing_interval=cint(self.billing_frequency),
+            allowance_months=cint(self.allowance_period),
+            allowance_in_period=bool(self.in_period),
+            allowance_out_period=bool(self.out_period),
+            rent_total=rent_total,
+            periods=periods,
+        )
 
-    def add_paid_invoices(self, schedule, start_date, end_date, total_months, billing_interval, monthly_rent):
-        if total_months <= 0:
-            return
-        
-        current_date = start_date
-        remaining_months = total_months
-        
-        while remaining_months > 0:
-            months_in_invoice = min(billing_interval, remaining_months)
-            period_start = current_date
-            
-            if remaining_months <= billing_interval:
-                period_end = end_date
-            else:
-                period_end = get_last_day(add_months(period_start, months_in_invoice - 1))
-            
-            invoice_amount = rounded(flt(monthly_rent * months_in_invoice, 6), 6)
-            
-            schedule.append("invoice", {
-                "lease_start": period_start,
-                "lease_end": period_end,
-                "amount": invoice_amount,
-                "is_allowance": 0
-            })
-            
-            current_date = add_months(current_date, months_in_invoice)
-            remaining_months -= months_in_invoice
-            
     def update_floor_unit(self):
-        if self.rent_details:
-            for floor in self.rent_details:
-                if floor.floor_unit:
-                    frappe.db.set_value("Floor Unit", floor.floor_unit, "rent_space", 1)
-                    frappe.db.set_value("Floor Unit", floor.floor_unit, "tenant", self.tenant_lessee)
-                    try:
-                        floor_unit_doc = frappe.get_doc("Floor Unit", floor.floor_unit)
-                        create_floor_unit_log(floor_unit_doc)
-                    except Exception as e:
-                        frappe.throw(f"Error Logging Floor Unit: {e}")
-            frappe.db.commit()
-            
+        """Rent the contract's floor units to the tenant with one UPDATE and log them in one INSERT,
+        inside the submit transaction."""
+        tenants = {floor.floor_unit: self.tenant_lessee for floor in self.rent_details or [] if floor.floor_unit}
+        if not tenants:
+            return
+
+        rent_floor_units(tenants)
+        try:
+            create_floor_unit_logs(list(tenants))
+        except Exception as e:
+            frappe.throw(f"Error Logging Floor Unit: {e}")
+
     def renew_lease(self, renewal_self):
         renewal_doc = frappe.get_doc("Lease Contract", renewal_self)
         frappe.db.set_value(renewal_doc.doctype, renewal_doc.name, "status", "Renewal")
-        frappe.db.commit()
+        end_unit_occupancy(renewal_doc.name, self.lease_start)
         renewal_doc.reload()
         create_log(renewal_doc)
         
@@ -263,15 +227,16 @@ class LeaseContract(Document):
     @frappe.whitelist()
     def terminate_lease(self):
         if self.rent_details:
-            for floor in self.rent_details:
-                if floor.floor_unit:
-                    try:
-                        floor_unit_doc = frappe.get_doc("Floor Unit", floor.floor_unit)
-                        floor_unit_doc.release_from_lease()
-                    except Exception as e:
-                        frappe.throw(f"Error Reverse Unit SE: {e}")
-            
+            try:
+                release_floor_units(
+                    [floor.floor_unit for floor in self.rent_details if floor.floor_unit],
+                    remarks=f"Release of floor units of Lease Contract {self.name}"
+                )
+            except Exception as e:
+                frappe.throw(f"Error Reverse Unit SE: {e}")
+
             frappe.db.set_value(self.doctype, self.name, "status", "Terminated")
+            end_unit_occupancy(self.name)
             frappe.db.commit()
             
             self.reload()
@@ -286,7 +251,9 @@ class LeaseContract(Document):
         
 
     @frappe.whitelist()
-    def generate_schedule_preview(self):
+    def generate_schedule_preview(self, known_hash=None):
+        """Preview the schedule submit would create. Results are cached by a hash of the billing
+        terms; when the caller already holds the preview for `known_hash`, only a marker is returned."""
         if not self.lease_start or not self.lease_end:
             frappe.throw("Lease start and end dates must be set to preview lease schedule")
             
@@ -296,133 +263,40 @@ class LeaseContract(Document):
         if not self.billing_frequency:
             frappe.throw("Billing frequency must be set to preview lease schedule")
 
-        preview_data = {
-            "invoice": [],
-            "total_period": 0
-        }
-
-        billing_interval = cint(self.billing_frequency)
-        allowance_months = self.allowance_period if self.allowance_period else 0
-
-        if self.contract_multi_period:
-            if not self.period_details:
-                frappe.throw("Period details are required for multi-period contracts to preview lease schedule")
-
-            total_schedule_months = 0
-            free_months_applied = False
-
-            if self.out_period and allowance_months > 0:
-                first_period_start = getdate(self.period_details[0].from_date)
-                self.preview_free_months(preview_data, first_period_start, allowance_months)
-                shift_months = allowance_months
-            else:
-                shift_months = 0
-
-            for idx, period in enumerate(self.period_details):
-                period_start = getdate(period.from_date)
-                period_end = getdate(period.to_date)
-                months_in_period = cint(period.month_in_period)
-                monthly_rent = flt(period.amount) / months_in_period
-
-                current_start = add_months(period_start, shift_months) if idx == 0 else period_start
-
-                if self.in_period and allowance_months > 0 and not free_months_applied:
-                    self.preview_free_months(preview_data, current_start, allowance_months)
-                    current_start = add_months(current_start, allowance_months)
-                    free_months_applied = True
-                    monthly_rent = flt(period.amount) / (months_in_period - allowance_months)
-
-                paid_period_end = period_end
-                if self.in_period and allowance_months > 0 and idx == 0:
-                    paid_period_end = add_months(current_start, months_in_period - allowance_months) - relativedelta(days=1)
-
-                self.preview_paid_invoices(preview_data, current_start, paid_period_end, 
-                                            months_in_period if idx > 0 else months_in_period - (allowance_months if self.in_period else 0), 
-                                            billing_interval, monthly_rent)
-                total_schedule_months += months_in_period
-
-            if self.out_period and allowance_months > 0:
-                total_schedule_months += allowance_months
+        if self.contract_multi_period and not self.period_details:
+            frappe.throw("Period details are required for multi-period contracts to preview lease schedule")
 
-            preview_data["total_period"] = total_schedule_months
-            return preview_data
-
-        if not self.rent_details:
+        if not self.contract_multi_period and not self.rent_details:
             frappe.throw("Rent details are required to preview lease schedule")
 
-        start_date = getdate(self.lease_start)
-        end_date = getdate(self.lease_end)
-        total_months = self.period_in_months
-
-        rent_total = sum(flt(d.amount) for d in self.rent_details if d.rent_space)
-        service_total = sum(flt(d.amount) for d in self.rent_details if not d.rent_space)
-        total_rent = rent_total + service_total
-        monthly_rent = flt(total_rent) / flt(total_months)
-        total_months_with_allowance = total_months
-        
-        if self.out_period and allowance_months > 0:
-            total_months_with_allowance += allowance_months
-        if self.in_period and allowance_months > 0:
-            monthly_rent = flt(total_rent / (total_months - allowance_months))
-
-        preview_data["total_period"] = total_months_with_allowance
-        current_start = start_date
-
-        if self.in_period and allowance_months > 0:
-            self.preview_free_months(preview_data, current_start, allowance_months)
-            current_start = add_months(current_start, allowance_months)
-            self.preview_paid_invoices(preview_data, current_start, end_date, total_months - allowance_months, billing_interval, monthly_rent)
-        elif self.out_period and allowance_months > 0:
-            self.preview_free_months(preview_data, current_start, allowance_months)
-            current_start = add_months(current_start, allowance_months)
-            total_months_with_allowance = total_months + allowance_months
-            extended_end_date = add_months(end_date, allowance_months)
-            self.preview_paid_invoices(preview_data, current_start, extended_end_date, total_months, billing_interval, monthly_rent)
-        else:
-            self.preview_paid_invoices(preview_data, current_start, end_date, total_months, billing_interval, monthly_rent)
-
-        return preview_data
-
-    def preview_free_months(self, preview_data, start_date, num_months):
-        current_date = start_date
-        
-        for i in range(num_months):
-            period_start = current_date
-            period_end = get_last_day(period_start)
-            
-            preview_data["invoice"].append({
-                "lease_start": str(period_start),
-                "lease_end": str(period_end),
-                "amount": 0,
-                "is_allowance": 1
-            })
-            
-            current_date = add_months(current_date, 1)
-
-    def preview_paid_invoices(self, preview_data, start_date, end_date, total_months, billing_interval, monthly_rent):
-        if flt(total_months) <= 0:
-            return
-        
-        current_date = start_date
-        remaining_months = flt(total_months)
-        
-        while remaining_months > 0:
-            months_in_invoice = min(billing_interval, remaining_months)
-            period_start = current_date
-            
-            if remaining_months <= billing_interval:
-                period_end = end_date
-            else:
-                period_end = get_last_day(add_months(period_start, months_in_invoice - 1))
-            
-            invoice_amount = monthly_rent * months_in_invoice
-            
-            preview_data["invoice"].append({
-                "lease_start": str(period_start),
-                "lease_end": str(period_end),
-                "amount": invoice_amount,
-                "is_allowance": 0
-            })
-            
-            current_date = add_months(current_date, months_in_invoice)
-            remaining_months -= months_in_invoice
\ No newline at end of file
+        terms = self.get_schedule_terms()
+        terms_hash = get_schedule_terms_hash(terms)
+
+        if known_hash == terms_hash:
+            return {"not_modified": 1, "hash": terms_hash}
+
+        cache_key = f"masar_mall:schedule_preview:{terms_hash}"
+        preview_data = frappe.cache().get_value(cache_key)
+
+        if not preview_data:
+            lease_schedule = build_lease_schedule(terms)
+            preview_data = {
+                "invoice": [
+                    {
+                        "lease_start": str(row.lease_start),
+                        "lease_end": str(row.lease_end),
+                        "amount": row.amount,
+                        "is_allowance": row.is_allowance
+                    }
+                    for row in lease_schedule.rows
+                ],
+                "total_period": lease_schedule.total_period
+            }
+            frappe.cache().set_value(cache_key, preview_data, expires_in_sec=SCHEDULE_PREVIEW_CACHE_TTL)
+
+        return dict(preview_data, hash=terms_hash)
+
+
+def get_schedule_terms_hash(terms):
+    """Stable hash of only the inputs the schedule depends on."""
+    return hashlib.sha256(json.dumps(terms, default=str).encode()).hexdigest()[:20]
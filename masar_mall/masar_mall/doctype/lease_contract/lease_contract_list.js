@@ -0,0 +1,41 @@
+// Copyright (c) 2025, KCSC and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Lease Contract"] = {
+    onload: function (listview) {
+        if (!frappe.user.has_role("System Manager")) {
+            return;
+        }
+
+        listview.page.add_inner_button(__("Renew Expiring Contracts"), function () {
+            const dialog = new frappe.ui.Dialog({
+                title: __("Renew Expiring Contracts"),
+                fields: [
+                    { fieldname: "lease_end_from", fieldtype: "Date", label: __("Lease End From"), reqd: 1 },
+                    { fieldname: "lease_end_to", fieldtype: "Date", label: __("Lease End To"), reqd: 1 },
+                    { fieldname: "property", fieldtype: "Link", label: __("Property"), options: "Property" },
+                    {
+                        fieldname: "status", fieldtype: "Select", label: __("Status"),
+                        options: "Rent\nRenewal\nLegal Case", default: "Rent"
+                    },
+                    {
+                        fieldname: "escalation_percent", fieldtype: "Percent", label: __("Rent Escalation"),
+                        default: 0, description: __("Leave at 0 to carry the current amounts over")
+                    },
+                    { fieldname: "submit", fieldtype: "Check", label: __("Submit Renewals"), default: 0 }
+                ],
+                primary_action_label: __("Renew"),
+                primary_action: function (values) {
+                    frappe.call({
+                        method: "masar_mall.jobs.lease_renewal.enqueue_mass_renewal",
+                        args: values,
+                        callback: function () {
+                            dialog.hide();
+                        }
+                    });
+                }
+            });
+            dialog.show();
+        });
+    }
+};
@@ -3,8 +3,17 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import getdate
+
+INVOICE_ROW_FIELDS = ["lease_start", "lease_end", "amount", "is_allowance", "invoice_number", "invoice_status"]
+
 
 class LeaseContractSchedule(Document):
+    def after_insert(self):
+        if self.flags.bulk_invoice_rows is not None:
+            self.set("invoice", self.flags.pop("bulk_invoice_rows"))
+            self.db_insert_invoice_rows()
+
     def on_submit(self):
         self.update_invoiced_period_counts()
 
@@ -21,3 +30,53 @@ class LeaseContractSchedule(Document):
         frappe.db.set_value(self.doctype, self.name, "number_of_invoiced_periods", invoiced_periods)
         frappe.db.set_value(self.doctype, self.name, "number_of_non_invoiced_periods", non_invoiced_periods)
         # frappe.db.commit()
+
+    def insert_submitted(self):
+        """Insert and submit the schedule in one pass, writing the invoice rows with a multi-row
+        INSERT instead of one INSERT and one round of child validation per row.
+
+        The parent is validated once; the rows come from the schedule engine, so they are only
+        checked for their dates. Runs under a savepoint, so a failure leaves no part of the
+        schedule behind.
+        """
+        rows = self.get("invoice")
+        for row in rows:
+            if not row.lease_start or not row.lease_end or getdate(row.lease_start) > getdate(row.lease_end):
+                frappe.throw(f"Row {row.idx}: Lease start must be on or before lease end")
+
+        frappe.db.savepoint("lease_schedule_insert")
+        try:
+            self.flags.bulk_invoice_rows = rows
+            self.set("invoice", [])
+            self.docstatus = 1
+            self.insert(ignore_permissions=True)
+
+        except Exception:
+            frappe.db.rollback(save_point="lease_schedule_insert")
+            self.flags.pop("bulk_invoice_rows", None)
+            raise
+
+        return self
+
+    def db_insert_invoice_rows(self):
+        now = frappe.utils.now_datetime()
+        user = frappe.session.user
+
+        values = []
+        for idx, row in enumerate(self.invoice, start=1):
+            row.name = frappe.generate_hash(length=10)
+            row.idx = idx
+            row.docstatus = self.docstatus
+            row.creation = row.modified = now
+            row.owner = row.modified_by = user
+            values.append(
+                [row.name, user, now, now, user, self.docstatus, self.name, self.doctype, "invoice", idx]
+                + [row.get(field) for field in INVOICE_ROW_FIELDS]
+            )
+
+        frappe.db.bulk_insert(
+            "Lease Contrant invoice",
+            ["name", "owner", "creation", "modified", "modified_by", "docstatus", "parent", "parenttype", "parentfield", "idx"]
+            + INVOICE_ROW_FIELDS,
+            values
+        )
@@ -3,18 +3,19 @@
 
 import frappe
 from frappe.model.document import Document
+from masar_mall.utils.floor_occupancy import refresh_floor_occupancy, refresh_floor_unit_occupancy
+from masar_mall.utils.rental_space_config import get_rental_space_config
 
 
 class UnitManagment(Document):
 
     def on_submit(self):
-        wh_ta = frappe.db.get_value("Warehouse", {"warehouse_type": "Rental Space"}, "name")
-        item_code = frappe.get_value("Item", {"is_stock_item": 1, "custom_rent_space": 1}, "name")
+        config = get_rental_space_config(self.company)
+        wh_ta = config.warehouse
+        item_code = config.item_code
         if not item_code:
             frappe.throw("No stock item with Rent Space enabled was found. Please create or update an Item.")
 
-        item = frappe.get_doc("Item", item_code)
-
         # Rent Space New Floor Unit
         if self.action_type == 'Rent Space' and self.is_new_floor_unit:
             fr_new_unit = frappe.get_doc({
@@ -43,7 +44,7 @@ class UnitManagment(Document):
                 "posting_date": self.date,
                 "items": [
                     {
-                        "item_code": item.name,
+                        "item_code": item_code,
                         "qty": self.rent_exist_area,
                         "floor_unit": self.return_exit_unit,
                         "to_floor_unit": self.return_exit_unit,
@@ -64,7 +65,7 @@ class UnitManagment(Document):
                 "posting_date": self.date,
                 "items": [
                     {
-                        "item_code": item.name,
+                        "item_code": item_code,
                         "qty": self.new_area,
                         "floor_unit": self.return_exit_unit,
                         "to_floor_unit": self.return_exit_unit,
@@ -93,7 +94,7 @@ class UnitManagment(Document):
                 "posting_date": self.date,
                 "items": [
                     {
-                        "item_code": item.name,
+                        "item_code": item_code,
                         "qty": self.exit_area,
                         "floor_unit": self.return_exit_unit,
                         "to_floor_unit": self.return_exit_unit,
@@ -110,3 +111,6 @@ class UnitManagment(Document):
                 return_exit_unit_doc.db_set("return_space", 1)
 
             frappe.msgprint(f"Floor Unit '{self.return_exit_unit}' marked as Returned Space.")
+
+        refresh_floor_occupancy([(self.property, self.floor)])
+        refresh_floor_unit_occupancy([unit for unit in (self.return_exit_unit, self.rent_exist_unit) if unit])
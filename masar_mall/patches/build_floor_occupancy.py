@@ -0,0 +1,5 @@
+from masar_mall.utils.floor_occupancy import rebuild_floor_occupancy
+
+
+def execute():
+    rebuild_floor_occupancy()
@@ -0,0 +1,5 @@
+from masar_mall.utils.floor_unit_occupancy import rebuild_unit_occupancy
+
+
+def execute():
+    rebuild_unit_occupancy()
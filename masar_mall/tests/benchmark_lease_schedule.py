@@ -0,0 +1,50 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+"""Microbenchmark for the lease schedule engine.
+
+Run with `python -m masar_mall.tests.benchmark_lease_schedule` from the app directory.
+"""
+
+import random
+import timeit
+from datetime import date, timedelta
+
+from masar_mall.tests.test_lease_schedule import random_terms
+from masar_mall.utils.lease_schedule import LeaseTerms, add_months, build_lease_schedule
+
+
+def thirty_year_terms(billing_interval=1):
+	lease_start = date(2025, 1, 31)
+	return LeaseTerms(
+		lease_start=lease_start,
+		lease_end=add_months(lease_start, 360) - timedelta(days=1),
+		period_in_months=360,
+		billing_interval=billing_interval,
+		allowance_months=3,
+		allowance_in_period=True,
+		rent_total=12_345_678.9,
+	)
+
+
+def report(label, seconds, runs, unit):
+	print(f"{label:<40} {seconds / runs * 1000:10.3f} ms per {unit}")
+
+
+def main():
+	for billing_interval in (1, 3, 12):
+		terms = thirty_year_terms(billing_interval)
+		runs = 2000
+		seconds = timeit.timeit(lambda: build_lease_schedule(terms), number=runs)
+		report(f"30-year contract, {billing_interval}-month billing", seconds, runs, "schedule")
+
+	rng = random.Random(10_000)
+	contracts = [random_terms(rng) for _ in range(10_000)]
+	seconds = min(timeit.repeat(lambda: [build_lease_schedule(terms) for terms in contracts], number=1, repeat=3))
+	rows = sum(len(build_lease_schedule(terms).rows) for terms in contracts)
+	report("10k mixed schedules", seconds, 1, "batch")
+	print(f"{'':<40} {rows} rows, {rows / seconds:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,79 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+"""Submit latency of a Lease Contract Schedule against its number of invoice rows.
+
+Compares the per-row `insert()` + `submit()` path with `insert_submitted()`. Needs a site and
+rolls back everything it writes:
+
+    bench --site <site> execute masar_mall.tests.benchmark_schedule_submit.main
+"""
+
+import time
+from datetime import date, timedelta
+
+import frappe
+
+from masar_mall.utils.lease_schedule import LeaseTerms, add_months, build_lease_schedule
+
+
+SCHEDULE_MONTHS = (12, 60, 120, 360, 720)
+RUNS = 5
+
+
+def make_schedule(months):
+	lease_start = date(2025, 1, 1)
+	terms = LeaseTerms(
+		lease_start=lease_start,
+		lease_end=add_months(lease_start, months) - timedelta(days=1),
+		period_in_months=months,
+		billing_interval=1,
+		rent_total=1000.0 * months,
+	)
+	lease_schedule = build_lease_schedule(terms)
+
+	schedule = frappe.new_doc("Lease Contract Schedule")
+	schedule.lease_contract = "Benchmark"
+	schedule.posting_date = lease_start
+	schedule.total_peroid = lease_schedule.total_period
+	schedule.flags.ignore_links = True
+	for row in lease_schedule.rows:
+		schedule.append("invoice", {
+			"lease_start": row.lease_start,
+			"lease_end": row.lease_end,
+			"amount": row.amount,
+			"is_allowance": row.is_allowance
+		})
+	return schedule
+
+
+def per_row_submit(schedule):
+	schedule.insert(ignore_permissions=True)
+	schedule.submit()
+
+
+def bulk_submit(schedule):
+	schedule.insert_submitted()
+
+
+def time_submit(submit, months):
+	timings = []
+	for _ in range(RUNS):
+		schedule = make_schedule(months)
+		frappe.db.savepoint("schedule_benchmark")
+		started = time.perf_counter()
+		submit(schedule)
+		timings.append(time.perf_counter() - started)
+		frappe.db.rollback(save_point="schedule_benchmark")
+	return min(timings) * 1000
+
+
+def main():
+	print(f"{'rows':>6} {'insert + submit':>18} {'insert_submitted':>18} {'speed-up':>9}")
+	try:
+		for months in SCHEDULE_MONTHS:
+			per_row = time_submit(per_row_submit, months)
+			bulk = time_submit(bulk_submit, months)
+			print(f"{months:>6} {per_row:>15.1f} ms {bulk:>15.1f} ms {per_row / bulk:>8.1f}x")
+	finally:
+		frappe.db.rollback()
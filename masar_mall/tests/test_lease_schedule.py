@@ -0,0 +1,213 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+import random
+import unittest
+from datetime import date, timedelta
+
+from masar_mall.utils.lease_schedule import (
+	ContractPeriod,
+	LeaseTerms,
+	MonthCalendar,
+	add_months,
+	build_lease_schedule,
+	get_last_day,
+)
+
+
+SEED = 20250101
+CASES = 500
+
+
+def naive_add_months(value, months):
+	"""Step month by month and back off the day until it exists."""
+	year, month = value.year, value.month
+	for _ in range(abs(months)):
+		month += 1 if months > 0 else -1
+		if month == 13:
+			year, month = year + 1, 1
+		elif month == 0:
+			year, month = year - 1, 12
+
+	day = value.day
+	while True:
+		try:
+			return date(year, month, day)
+		except ValueError:
+			day -= 1
+
+
+def random_terms(rng, multi_period=None):
+	lease_start = date(2000, 1, 1) + timedelta(days=rng.randrange(365 * 30))
+	allowance = rng.choice([0, 0, 1, 2, 3, 6])
+	mode = rng.choice(["in", "out"]) if allowance else None
+	multi_period = rng.random() < 0.5 if multi_period is None else multi_period
+
+	if not multi_period:
+		months = rng.randint(allowance + 1, 360)
+		return LeaseTerms(
+			lease_start=lease_start,
+			lease_end=add_months(lease_start, months) - timedelta(days=1),
+			period_in_months=months,
+			billing_interval=rng.choice([1, 2, 3, 4, 6, 12]),
+			allowance_months=allowance,
+			allowance_in_period=mode == "in",
+			allowance_out_period=mode == "out",
+			rent_total=round(rng.uniform(100, 5_000_000), 2),
+		)
+
+	periods = []
+	period_start = lease_start
+	for idx in range(rng.randint(1, 6)):
+		months = rng.randint(allowance + 1 if idx == 0 else 1, 60)
+		period_end = add_months(period_start, months) - timedelta(days=1)
+		periods.append(ContractPeriod(period_start, period_end, months, round(rng.uniform(100, 1_000_000), 2)))
+		period_start = period_end + timedelta(days=1)
+
+	return LeaseTerms(
+		lease_start=lease_start,
+		lease_end=periods[-1].to_date,
+		period_in_months=sum(p.months for p in periods),
+		billing_interval=rng.choice([1, 2, 3, 4, 6, 12]),
+		allowance_months=allowance,
+		allowance_in_period=mode == "in",
+		allowance_out_period=mode == "out",
+		periods=tuple(periods),
+	)
+
+
+class TestLeaseScheduleCalendar(unittest.TestCase):
+	def test_add_months_matches_naive_stepping(self):
+		rng = random.Random(SEED)
+		for _ in range(CASES * 4):
+			value = date(1990, 1, 1) + timedelta(days=rng.randrange(365 * 60))
+			months = rng.randint(-48, 48)
+			self.assertEqual(add_months(value, months), naive_add_months(value, months))
+
+	def test_add_months_clamps_to_month_end(self):
+		self.assertEqual(add_months(date(2024, 1, 31), 1), date(2024, 2, 29))
+		self.assertEqual(add_months(date(2023, 1, 31), 1), date(2023, 2, 28))
+		self.assertEqual(add_months(date(2024, 2, 29), 12), date(2025, 2, 28))
+
+	def test_step_dates_match_chained_add_months(self):
+		rng = random.Random(SEED)
+		calendar = MonthCalendar(1990, 2060)
+		for _ in range(CASES):
+			start = date(1990, 1, 1) + timedelta(days=rng.randrange(365 * 40))
+			steps = [rng.choice([1, 2, 3, 4, 6, 12]) for _ in range(rng.randint(0, 60))]
+
+			expected = [start]
+			for step in steps:
+				expected.append(add_months(expected[-1], step))
+
+			indexes, dates = calendar.step_dates(start, steps)
+			self.assertEqual(dates, expected)
+			self.assertEqual(calendar.month_ends(indexes), [get_last_day(value) for value in expected])
+
+	def test_get_last_day(self):
+		self.assertEqual(get_last_day(date(2024, 2, 10)), date(2024, 2, 29))
+		self.assertEqual(get_last_day(date(2023, 12, 1)), date(2023, 12, 31))
+
+
+class TestLeaseScheduleEngine(unittest.TestCase):
+	def test_single_period_monthly(self):
+		terms = LeaseTerms(date(2025, 1, 1), date(2025, 12, 31), 12, 3, rent_total=1200)
+		schedule = build_lease_schedule(terms)
+
+		self.assertEqual(schedule.total_period, 12)
+		self.assertEqual(
+			[(row.lease_start, row.lease_end, row.amount) for row in schedule.rows],
+			[
+				(date(2025, 1, 1), date(2025, 3, 31), 300),
+				(date(2025, 4, 1), date(2025, 6, 30), 300),
+				(date(2025, 7, 1), date(2025, 9, 30), 300),
+				(date(2025, 10, 1), date(2025, 12, 31), 300),
+			]
+		)
+
+	def test_allowance_inside_billing_period(self):
+		terms = LeaseTerms(
+			date(2025, 1, 1), date(2025, 12, 31), 12, 6,
+			allowance_months=2, allowance_in_period=True, rent_total=1000
+		)
+		schedule = build_lease_schedule(terms)
+
+		self.assertEqual(schedule.total_period, 12)
+		self.assertEqual([row.is_allowance for row in schedule.rows], [1, 1, 0, 0])
+		self.assertEqual(schedule.rows[2].lease_start, date(2025, 3, 1))
+		self.assertEqual([row.amount for row in schedule.rows[2:]], [600, 400])
+
+	def test_allowance_outside_billing_period(self):
+		terms = LeaseTerms(
+			date(2025, 1, 1), date(2025, 12, 31), 12, 12,
+			allowance_months=1, allowance_out_period=True, rent_total=1200
+		)
+		schedule = build_lease_schedule(terms)
+
+		self.assertEqual(schedule.total_period, 13)
+		self.assertEqual(schedule.rows[1], (date(2025, 2, 1), date(2026, 1, 31), 1200, 0, 12))
+
+	def test_rejects_zero_billing_interval(self):
+		with self.assertRaises(ValueError):
+			build_lease_schedule(LeaseTerms(date(2025, 1, 1), date(2025, 12, 31), 12, 0, rent_total=1))
+
+	def test_properties_hold_for_random_contracts(self):
+		rng = random.Random(SEED)
+		for _ in range(CASES):
+			terms = random_terms(rng)
+			with self.subTest(terms=terms):
+				self.check_schedule(terms, build_lease_schedule(terms))
+
+	def test_is_deterministic(self):
+		rng = random.Random(SEED)
+		for _ in range(50):
+			terms = random_terms(rng)
+			self.assertEqual(build_lease_schedule(terms), build_lease_schedule(terms))
+
+	def check_schedule(self, terms, schedule):
+		allowance = terms.allowance_months
+		free_rows = [row for row in schedule.rows if row.is_allowance]
+		paid_rows = [row for row in schedule.rows if not row.is_allowance]
+
+		# Allowance rows come first, one per month, each ending on its month's last day
+		self.assertEqual(len(free_rows), allowance)
+		self.assertEqual(schedule.rows[:allowance], free_rows)
+		for row in free_rows:
+			self.assertEqual(row.amount, 0)
+			self.assertEqual(row.lease_end, get_last_day(row.lease_start))
+
+		# Every month of the contract is either free or billed exactly once
+		expected_total = terms.period_in_months + (allowance if terms.allowance_out_period else 0)
+		self.assertEqual(schedule.total_period, expected_total)
+		self.assertEqual(sum(row.months for row in schedule.rows), expected_total)
+
+		for row in paid_rows:
+			self.assertLessEqual(row.months, terms.billing_interval)
+			self.assertGreater(row.amount, 0)
+
+		# Rows never overlap, and within a run of free or billed rows each starts where the
+		# previous one's months run out; billing restarts from the lease start after allowance
+		for previous, row in zip(schedule.rows, schedule.rows[1:]):
+			self.assertGreater(row.lease_start, previous.lease_end)
+			if not terms.periods and row.is_allowance == previous.is_allowance:
+				self.assertEqual(row.lease_start, add_months(previous.lease_start, previous.months))
+
+		if not terms.periods:
+			self.assertEqual(paid_rows[-1].lease_end, add_months(
+				terms.lease_end, allowance if terms.allowance_out_period else 0
+			))
+			# Rounding the monthly rent to 6 places costs at most half a unit per month and row
+			tolerance = 1e-6 * (expected_total + len(paid_rows))
+			self.assertAlmostEqual(sum(row.amount for row in paid_rows), terms.rent_total, delta=tolerance)
+		elif not (terms.allowance_out_period and allowance):
+			# Without a leading allowance shift every period bills its own amount
+			for period in terms.periods:
+				billed = sum(
+					row.amount for row in paid_rows
+					if period.from_date <= row.lease_start <= period.to_date
+				)
+				self.assertAlmostEqual(billed, period.amount, delta=1e-6 * 2 * (period.months + 1))
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -39,4 +39,67 @@ def create_log(self):
             })
 
     log.insert(ignore_permissions=True)
-    log.submit()
\ No newline at end of file
+    log.submit()
+
+def create_logs(docs):
+    """Write a submitted Lease Contract Log for each contract in `docs` with multi-row INSERTs."""
+    if not docs:
+        return
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    standard = ["name", "owner", "creation", "modified", "modified_by", "docstatus"]
+
+    logs = []
+    rent_rows = []
+    for doc in docs:
+        log_name = frappe.generate_hash(length=10)
+        logs.append((
+            log_name, user, now, now, user, 1,
+            doc.name, doc.tenant_lessee, doc.lease_start, doc.lease_end, doc.status or "",
+        ))
+        for idx, rent_row in enumerate(doc.rent_details or [], start=1):
+            rent_rows.append((
+                frappe.generate_hash(length=10), user, now, now, user, 1,
+                log_name, "Lease Contract Log", "rent_details", idx,
+                rent_row.rent_item, rent_row.floor_unit, rent_row.rate, rent_row.amount,
+            ))
+
+    frappe.db.bulk_insert(
+        "Lease Contract Log",
+        standard + ["lease_contract", "tenant_lessee", "lease_start", "lease_end", "status"],
+        logs
+    )
+    frappe.db.bulk_insert(
+        "Lease Contract Details",
+        standard + ["parent", "parenttype", "parentfield", "idx", "rent_item", "floor_unit", "rate", "amount"],
+        rent_rows
+    )
+
+
+def create_floor_unit_logs(floor_units):
+    """Write a submitted Floor Unit Log with the current state of each of `floor_units` in one INSERT."""
+    if not floor_units:
+        return
+
+    fields = [
+        "floor_unit_name", "floor", "space", "property", "company", "ref_doc",
+        "tenant", "rent_space", "free_space", "disabled",
+    ]
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+
+    units = frappe.get_all(
+        "Floor Unit",
+        filters={"name": ("in", list(floor_units))},
+        fields=["name"] + fields
+    )
+
+    frappe.db.bulk_insert(
+        "Floor Unit Log",
+        ["name", "owner", "creation", "modified", "modified_by", "docstatus", "floor_unit"] + fields,
+        [
+            [frappe.generate_hash(length=10), user, now, now, user, 1, unit.name] + [unit[field] for field in fields]
+            for unit in units
+        ]
+    )
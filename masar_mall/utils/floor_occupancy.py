@@ -0,0 +1,111 @@
+import frappe
+
+
+OCCUPANCY_FIELDS = [
+    "total_area", "rented_area", "free_area", "disabled_area",
+    "total_units", "rented_units", "free_units", "disabled_units",
+]
+
+
+def get_occupancy_name(property, floor):
+    # Matches the Floor Occupancy autoname, so a floor's row is read by primary key
+    return f"{property}-{floor}"
+
+
+@frappe.whitelist()
+def get_floor_occupancy(property, floor=None):
+    """Occupancy of one floor, or the totals of a property when `floor` is not given."""
+    frappe.has_permission("Floor Unit", "read", throw=True)
+
+    if floor:
+        occupancy = frappe.db.get_value(
+            "Floor Occupancy", get_occupancy_name(property, floor), ["property", "floor"] + OCCUPANCY_FIELDS, as_dict=True
+        )
+        return occupancy or frappe._dict(dict.fromkeys(OCCUPANCY_FIELDS, 0), property=property, floor=floor)
+
+    totals = frappe.db.sql(f"""
+        SELECT {", ".join(f"COALESCE(SUM({field}), 0) AS {field}" for field in OCCUPANCY_FIELDS)}
+        FROM `tabFloor Occupancy`
+        WHERE property = %(property)s
+    """, {"property": property}, as_dict=True)[0]
+    totals.property = property
+    return totals
+
+
+def refresh_floor_occupancy(floors):
+    """Recount the Floor Occupancy rows of `floors`, an iterable of (property, floor) pairs.
+
+    Each floor is aggregated from its submitted Floor Units with one grouped query for all of
+    them and written back with one upsert, inside the caller's transaction.
+    """
+    floors = {(property, floor) for property, floor in floors if property and floor}
+    if not floors:
+        return
+
+    counts = {
+        (row.property, row.floor): row
+        for row in frappe.db.sql(f"""
+            SELECT
+                property,
+                floor,
+                COALESCE(SUM(space), 0) AS total_area,
+                COALESCE(SUM(IF(disabled = 0 AND rent_space = 1, space, 0)), 0) AS rented_area,
+                COALESCE(SUM(IF(disabled = 0 AND rent_space = 0, space, 0)), 0) AS free_area,
+                COALESCE(SUM(IF(disabled = 1, space, 0)), 0) AS disabled_area,
+                COUNT(*) AS total_units,
+                SUM(disabled = 0 AND rent_space = 1) AS rented_units,
+                SUM(disabled = 0 AND rent_space = 0) AS free_units,
+                SUM(disabled = 1) AS disabled_units
+            FROM `tabFloor Unit`
+            WHERE docstatus = 1
+                AND (property, floor) IN ({", ".join(["(%s, %s)"] * len(floors))})
+            GROUP BY property, floor
+        """, [value for pair in floors for value in pair], as_dict=True)
+    }
+
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+    values = []
+    for property, floor in sorted(floors):
+        row = counts.get((property, floor)) or {}
+        values += [get_occupancy_name(property, floor), user, now, now, user, property, floor]
+        values += [row.get(field) or 0 for field in OCCUPANCY_FIELDS]
+
+    columns = ["name", "owner", "creation", "modified", "modified_by", "property", "floor"] + OCCUPANCY_FIELDS
+    frappe.db.sql(f"""
+        INSERT INTO `tabFloor Occupancy` ({", ".join(f"`{column}`" for column in columns)})
+        VALUES {", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(floors))}
+        ON DUPLICATE KEY UPDATE
+            {", ".join(f"`{column}` = VALUES(`{column}`)" for column in ["modified", "modified_by"] + OCCUPANCY_FIELDS)}
+    """, values)
+
+
+def refresh_floor_unit_occupancy(floor_units):
+    """Recount the floors that `floor_units` belong to."""
+    if not floor_units:
+        return
+
+    refresh_floor_occupancy(frappe.get_all(
+        "Floor Unit",
+        filters={"name": ("in", list(floor_units))},
+        fields=["property", "floor"],
+        distinct=True,
+        as_list=True
+    ))
+
+
+def rebuild_floor_occupancy(property=None):
+    """Recount every floor with submitted units, optionally of one property, and drop rows of
+    floors that no longer have any. Returns the number of floors written."""
+    filters = {"docstatus": 1}
+    if property:
+        filters["property"] = property
+
+    floors = frappe.get_all("Floor Unit", filters=filters, fields=["property", "floor"], distinct=True, as_list=True)
+    floors = [(unit_property, floor) for unit_property, floor in floors if unit_property and floor]
+
+    frappe.db.delete("Floor Occupancy", {"property": property} if property else None)
+    for start in range(0, len(floors), 500):
+        refresh_floor_occupancy(floors[start:start + 500])
+
+    return len(floors)
@@ -0,0 +1,91 @@
+import frappe
+from frappe.utils import add_days, getdate, nowdate
+
+
+def add_unit_occupancy(docs):
+    """Record the lease interval of every floor unit rented by the submitted contracts in `docs`."""
+    now = frappe.utils.now_datetime()
+    user = frappe.session.user
+
+    values = []
+    for doc in docs:
+        for floor_unit in get_contract_floor_units(doc):
+            values.append([
+                frappe.generate_hash(length=10), user, now, now, user,
+                floor_unit, doc.name, doc.tenant_lessee, doc.lease_start, doc.lease_end,
+            ])
+
+    frappe.db.bulk_insert(
+        "Floor Unit Occupancy",
+        ["name", "owner", "creation", "modified", "modified_by", "floor_unit", "lease_contract", "tenant", "lease_start", "lease_end"],
+        values
+    )
+
+
+def remove_unit_occupancy(lease_contract):
+    frappe.db.delete("Floor Unit Occupancy", {"lease_contract": lease_contract})
+
+
+def end_unit_occupancy(lease_contract, end_date=None):
+    """Cut the contract's intervals short so its units are free from `end_date`; intervals that
+    had not started yet are dropped."""
+    last_day = add_days(getdate(end_date or nowdate()), -1)
+
+    frappe.db.sql("""
+        DELETE FROM `tabFloor Unit Occupancy`
+        WHERE lease_contract = %(lease_contract)s AND lease_start > %(last_day)s
+    """, {"lease_contract": lease_contract, "last_day": last_day})
+    frappe.db.sql("""
+        UPDATE `tabFloor Unit Occupancy`
+        SET lease_end = %(last_day)s, modified = %(now)s
+        WHERE lease_contract = %(lease_contract)s AND lease_end > %(last_day)s
+    """, {"lease_contract": lease_contract, "last_day": last_day, "now": frappe.utils.now_datetime()})
+
+
+def get_overlapping_occupancy(floor_units, lease_start, lease_end, exclude_contracts=None):
+    """The first recorded interval of any of `floor_units` that overlaps lease_start..lease_end."""
+    if not floor_units:
+        return None
+
+    overlaps = frappe.db.sql("""
+        SELECT floor_unit, lease_contract, tenant, lease_start, lease_end
+        FROM `tabFloor Unit Occupancy`
+        WHERE floor_unit IN %(floor_units)s
+            AND lease_start <= %(lease_end)s
+            AND lease_end >= %(lease_start)s
+            AND lease_contract NOT IN %(exclude_contracts)s
+        ORDER BY lease_start
+        LIMIT 1
+    """, {
+        "floor_units": tuple(floor_units),
+        "lease_start": getdate(lease_start),
+        "lease_end": getdate(lease_end),
+        "exclude_contracts": tuple(name for name in exclude_contracts or [] if name) or ("",),
+    }, as_dict=True)
+
+    return overlaps[0] if overlaps else None
+
+
+@frappe.whitelist()
+def get_floor_unit_occupant(floor_unit, date=None):
+    """The contract and tenant occupying `floor_unit` on `date` (today by default), if any."""
+    frappe.has_permission("Lease Contract", "read", throw=True)
+
+    return get_overlapping_occupancy([floor_unit], date or nowdate(), date or nowdate())
+
+
+def get_contract_floor_units(doc):
+    return list(dict.fromkeys(row.floor_unit for row in doc.rent_details or [] if row.floor_unit))
+
+
+def rebuild_unit_occupancy():
+    """Recreate every interval from the submitted contracts that still hold their units."""
+    frappe.db.delete("Floor Unit Occupancy")
+
+    lease_names = frappe.get_all(
+        "Lease Contract",
+        filters={"docstatus": 1, "status": ("!=", "Terminated")},
+        pluck="name"
+    )
+    for start in range(0, len(lease_names), 500):
+        add_unit_occupancy([frappe.get_doc("Lease Contract", name) for name in lease_names[start:start + 500]])
@@ -0,0 +1,248 @@
+# Copyright (c) 2025, KCSC and contributors
+# For license information, please see license.txt
+
+"""Lease schedule engine shared by Lease Contract submit and the schedule preview.
+
+Pure Python on purpose: it takes plain contract terms and returns plain rows, so it can be
+used from controllers, background jobs and tests without loading documents.
+"""
+
+from calendar import monthrange
+from datetime import date, timedelta
+from itertools import accumulate
+from typing import NamedTuple
+
+
+AMOUNT_PRECISION = 6
+
+# Months past the lease end the calendar covers, for allowance shifts and the last billing row
+CALENDAR_MARGIN_YEARS = 2
+
+
+class ContractPeriod(NamedTuple):
+    """One row of a multi-period contract's period details."""
+    from_date: date
+    to_date: date
+    months: int
+    amount: float
+
+
+class LeaseTerms(NamedTuple):
+    lease_start: date
+    lease_end: date
+    period_in_months: int
+    billing_interval: int
+    allowance_months: int = 0
+    allowance_in_period: bool = False
+    allowance_out_period: bool = False
+    # Single-period contracts: total rent over the lease
+    rent_total: float = 0.0
+    # Multi-period contracts: the period details, in order
+    periods: tuple = ()
+
+
+class ScheduleRow(NamedTuple):
+    lease_start: date
+    lease_end: date
+    amount: float
+    is_allowance: int
+    months: int
+
+
+class LeaseSchedule(NamedTuple):
+    rows: list
+    total_period: int
+
+
+class MonthCalendar:
+    """Month boundaries of whole years `first_year` to `last_year`, as date ordinals.
+
+    Months are addressed by index from January of `first_year`, so stepping N months is
+    integer addition and a schedule's period boundaries come from a few list operations
+    instead of one round of date arithmetic per period.
+    """
+
+    __slots__ = ("first_year", "last_year", "month_starts", "month_lengths")
+
+    def __init__(self, first_year, last_year):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.month_starts = []
+        self.month_lengths = []
+
+        for year in range(first_year, last_year + 1):
+            for month in range(1, 13):
+                self.month_starts.append(date(year, month, 1).toordinal())
+                self.month_lengths.append(monthrange(year, month)[1])
+
+    def month_index(self, value):
+        return (value.year - self.first_year) * 12 + value.month - 1
+
+    def month_ends(self, indexes):
+        """Last day of each month in `indexes`."""
+        starts, lengths = self.month_starts, self.month_lengths
+        return [date.fromordinal(starts[idx] + lengths[idx] - 1) for idx in indexes]
+
+    def step_dates(self, start_date, steps):
+        """`start_date` followed by the dates reached by adding each of `steps` months in turn.
+
+        Same dates as chaining `add_months`: a day clamped to a short month stays clamped.
+        """
+        starts, lengths = self.month_starts, self.month_lengths
+        indexes = list(accumulate(steps, initial=self.month_index(start_date)))
+        days = accumulate((lengths[idx] for idx in indexes[1:]), min, initial=start_date.day)
+        return indexes, [date.fromordinal(starts[idx] + day - 1) for idx, day in zip(indexes, days)]
+
+    def covers(self, first_year, last_year):
+        return self.first_year <= first_year and last_year <= self.last_year
+
+
+_month_calendar = None
+
+
+def get_calendar_for(terms):
+    """The shared calendar, widened when a contract's span is not covered yet.
+
+    Bulk generation therefore precomputes the month boundaries once for all contracts.
+    """
+    global _month_calendar
+
+    first = min([terms.lease_start] + [p.from_date for p in terms.periods[:1]])
+    last = max([terms.lease_end] + [p.to_date for p in terms.periods[-1:]])
+    first_year = first.year
+    last_year = last.year + (terms.allowance_months or 0) // 12 + CALENDAR_MARGIN_YEARS
+
+    if not _month_calendar or not _month_calendar.covers(first_year, last_year):
+        if _month_calendar:
+            first_year = min(first_year, _month_calendar.first_year)
+            last_year = max(last_year, _month_calendar.last_year)
+        _month_calendar = MonthCalendar(first_year, last_year)
+
+    return _month_calendar
+
+
+def build_lease_schedule(terms):
+    """Return the allowance and billing rows of a contract and its total period in months."""
+    if terms.billing_interval < 1:
+        raise ValueError("Billing interval must be at least one month")
+
+    calendar = get_calendar_for(terms)
+
+    if terms.periods:
+        return build_multi_period_schedule(terms, calendar)
+
+    return build_single_period_schedule(terms, calendar)
+
+
+def build_single_period_schedule(terms, calendar):
+    rows = []
+    allowance = terms.allowance_months or 0
+    total_months = terms.period_in_months
+
+    monthly_rent = round_amount(terms.rent_total / total_months)
+    total_period = total_months
+
+    if terms.allowance_out_period and allowance > 0:
+        total_period += allowance
+    if terms.allowance_in_period and allowance > 0:
+        monthly_rent = round_amount(terms.rent_total / (total_months - allowance))
+
+    if terms.allowance_in_period and allowance > 0:
+        add_allowance_rows(rows, calendar, terms.lease_start, allowance)
+        add_billing_rows(
+            rows, calendar, add_months(terms.lease_start, allowance), terms.lease_end,
+            total_months - allowance, terms.billing_interval, monthly_rent
+        )
+    elif terms.allowance_out_period and allowance > 0:
+        add_allowance_rows(rows, calendar, terms.lease_start, allowance)
+        add_billing_rows(
+            rows, calendar, add_months(terms.lease_start, allowance), add_months(terms.lease_end, allowance),
+            total_months, terms.billing_interval, monthly_rent
+        )
+    else:
+        add_billing_rows(rows, calendar, terms.lease_start, terms.lease_end, total_months, terms.billing_interval, monthly_rent)
+
+    return LeaseSchedule(rows, total_period)
+
+
+def build_multi_period_schedule(terms, calendar):
+    rows = []
+    allowance = terms.allowance_months or 0
+    in_period = terms.allowance_in_period and allowance > 0
+    out_period = terms.allowance_out_period and allowance > 0
+    total_period = 0
+
+    if out_period:
+        add_allowance_rows(rows, calendar, terms.periods[0].from_date, allowance)
+
+    for idx, period in enumerate(terms.periods):
+        monthly_rent = round_amount(period.amount / period.months)
+        current_start = period.from_date
+        paid_end = period.to_date
+        paid_months = period.months
+
+        if idx == 0 and out_period:
+            current_start = add_months(current_start, allowance)
+
+        # An allowance inside the billing period is taken from the first period only
+        if idx == 0 and in_period:
+            add_allowance_rows(rows, calendar, current_start, allowance)
+            current_start = add_months(current_start, allowance)
+            paid_months = period.months - allowance
+            monthly_rent = round_amount(period.amount / paid_months)
+            paid_end = add_months(current_start, paid_months) - timedelta(days=1)
+
+        add_billing_rows(rows, calendar, current_start, paid_end, paid_months, terms.billing_interval, monthly_rent)
+        total_period += period.months
+
+    if out_period:
+        total_period += allowance
+
+    return LeaseSchedule(rows, total_period)
+
+
+def add_allowance_rows(rows, calendar, start_date, months):
+    """One free row per month, from `start_date` to the end of its month."""
+    if months <= 0:
+        return
+
+    indexes, starts = calendar.step_dates(start_date, [1] * (months - 1))
+    rows.extend(
+        ScheduleRow(row_start, row_end, 0, 1, 1)
+        for row_start, row_end in zip(starts, calendar.month_ends(indexes))
+    )
+
+
+def add_billing_rows(rows, calendar, start_date, end_date, months, billing_interval, monthly_rent):
+    """Billing rows of `billing_interval` months each; the last one runs to `end_date`."""
+    if months <= 0:
+        return
+
+    full_rows, last_months = divmod(months, billing_interval)
+    row_months = [billing_interval] * full_rows + ([last_months] if last_months else [])
+
+    indexes, starts = calendar.step_dates(start_date, row_months[:-1])
+    ends = calendar.month_ends([idx + count - 1 for idx, count in zip(indexes[:-1], row_months)])
+    ends.append(end_date)
+
+    amounts = {count: round_amount(monthly_rent * count) for count in set(row_months)}
+    rows.extend(
+        ScheduleRow(row_start, row_end, amounts[count], 0, count)
+        for row_start, row_end, count in zip(starts, ends, row_months)
+    )
+
+
+def add_months(value, months):
+    """Same result as `frappe.utils.add_months`: the day is clamped to the target month's length."""
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(value.day, monthrange(year, month)[1]))
+
+
+def get_last_day(value):
+    return date(value.year, value.month, monthrange(value.year, value.month)[1])
+
+
+def round_amount(value):
+    return round(value, AMOUNT_PRECISION)
@@ -0,0 +1,63 @@
+import frappe
+
+
+RENTAL_SPACE_CONFIG_CACHE_KEY = "masar_mall:rental_space_config"
+
+# Values of these fields decide whether a saved record can change the configuration
+CONFIG_FIELDS = {
+    "Item": ("custom_rent_space", [1]),
+    "Warehouse": ("warehouse_type", ["Rental Space"]),
+    "Account": ("account_type", ["Stock", "Temporary", "Stock Adjustment"]),
+}
+
+
+def get_rental_space_config(company=None):
+    """The rental space warehouse, rent space stock item and stock and expense accounts of
+    `company`, resolved once and kept in the site cache until one of them changes."""
+    config = frappe.cache().hget(RENTAL_SPACE_CONFIG_CACHE_KEY, company or "")
+    if config is None:
+        config = resolve_rental_space_config(company)
+        frappe.cache().hset(RENTAL_SPACE_CONFIG_CACHE_KEY, company or "", config)
+
+    return frappe._dict(config)
+
+
+def resolve_rental_space_config(company=None):
+    company_filter = {"company": company} if company else {}
+
+    warehouse = frappe.db.get_value("Warehouse", {"warehouse_type": "Rental Space", **company_filter}, "name")
+    if not warehouse and company:
+        warehouse = frappe.db.get_value("Warehouse", {"warehouse_type": "Rental Space"}, "name")
+
+    expense_account = None
+    if company:
+        expense_account = (
+            frappe.db.get_value("Account", {"account_type": "Temporary", "company": company}, "name")
+            or frappe.db.get_value("Account", {"account_type": "Stock Adjustment", "company": company}, "name")
+        )
+
+    return {
+        "warehouse": warehouse,
+        "item_code": frappe.db.get_value("Item", {"is_stock_item": 1, "custom_rent_space": 1}, "name"),
+        "stock_account": company and frappe.db.get_value("Account", {"account_type": "Stock", "company": company}, "name"),
+        "expense_account": expense_account,
+    }
+
+
+def clear_rental_space_config(doc=None, method=None, *args, **kwargs):
+    """doc_events handler for Item, Warehouse and Account: drop the cached configuration of every
+    company when a record that is, or was, part of it changes. Rename events also pass the old and
+    new names and the merge flag."""
+    if doc and not affects_rental_space_config(doc):
+        return
+
+    frappe.cache().delete_value(RENTAL_SPACE_CONFIG_CACHE_KEY)
+
+
+def affects_rental_space_config(doc):
+    fieldname, values = CONFIG_FIELDS.get(doc.doctype, (None, None))
+    if not fieldname:
+        return True
+
+    before = doc.get_doc_before_save()
+    return doc.get(fieldname) in values or bool(before and before.get(fieldname) in values)